@@ -0,0 +1,127 @@
+#
+# Benchmark suite of dodecahedron growth.
+# Author: Lovro Bosnar
+#
+# Runs without GPU or display:
+# - growth: pure growth math of `growth.py` (needs only NumPy, bpy and mathutils are not imported),
+# - pipeline: full `generative.py` run in background Blender, if Blender executable is found.
+# Sweeps n_iter, face_grow_factor_per_iter and number of prototypes and writes JSON with timings.
+# Given a previous result with --compare, configurations slower than --threshold are reported as regressions.
+#
+# python benchmark.py --output bench.json
+# python benchmark.py --blender /path/to/blender --compare bench.json
+#
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import growth
+import profiling
+
+N_ITERS = [6, 9, 12, 15]
+FACE_GROW_FACTORS_PER_ITER = [0.3, 0.45, 0.7]
+PROTOTYPE_COUNTS = [1, 4, 16]
+
+# Time pure growth for each configuration, best of repeats.
+def bench_growth(n_iters, face_grow_factors, prototype_counts, repeats=3, seed=0):
+    face_centers, face_normals, face_areas = growth.unit_penta_sphere_faces()
+    results = []
+    for n_iter, face_grow_factor_per_iter, n_prototypes in itertools.product(n_iters, face_grow_factors, prototype_counts):
+        best = None
+        for _ in range(repeats):
+            profiling.enable()
+            start = time.perf_counter()
+            structure = growth.grow_transforms(face_centers, face_normals, face_areas, n_iter=n_iter, scale_range=(0.9, 1.0),
+                                               n_prototypes=n_prototypes, face_grow_factor_per_iter=face_grow_factor_per_iter,
+                                               light_prototypes=np.ones(n_prototypes, dtype=bool), n_lights=3, seed=seed)
+            seconds = time.perf_counter() - start
+            report = profiling.report()
+            profiling.disable()
+            if best is None or seconds < best["seconds"]:
+                best = {"seconds": seconds, "iterations": report["iterations"]}
+        results.append({"suite": "growth", "n_iter": n_iter, "face_grow_factor_per_iter": face_grow_factor_per_iter,
+                        "n_prototypes": n_prototypes, "elements": len(structure["matrices"]), **best})
+    return results
+
+# Run full pipeline in background Blender for each configuration and collect its profiling report.
+def bench_pipeline(blender, n_iters, face_grow_factors, prototype_counts, instancing="points"):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generative.py")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_iter, face_grow_factor_per_iter, n_prototypes in itertools.product(n_iters, face_grow_factors, prototype_counts):
+            job_path = os.path.join(tmp_dir, "job.json")
+            profile_path = os.path.join(tmp_dir, "profile.json")
+            # Extruded pentasphere plus hollow variants.
+            job = {"n_iter": n_iter, "face_grow_factor_per_iter": face_grow_factor_per_iter, "instancing": instancing, "seed": 0,
+                   "hole_sizes": list(np.linspace(0.1, 0.6, max(n_prototypes - 1, 0))), "profile": profile_path}
+            with open(job_path, "w") as f:
+                json.dump(job, f)
+            start = time.perf_counter()
+            subprocess.run([blender, "-b", "--factory-startup", "-P", script, "--", "--job", job_path], check=True, stdout=subprocess.DEVNULL)
+            seconds = time.perf_counter() - start
+            with open(profile_path) as f:
+                report = json.load(f)
+            results.append({"suite": "pipeline", "n_iter": n_iter, "face_grow_factor_per_iter": face_grow_factor_per_iter,
+                            "n_prototypes": n_prototypes, "instancing": instancing, "seconds": seconds, "report": report})
+    return results
+
+def result_key(result):
+    return (result["suite"], result["n_iter"], result["face_grow_factor_per_iter"], result["n_prototypes"], result.get("instancing"))
+
+# Configurations slower than baseline by more than threshold (fraction).
+def find_regressions(results, baseline, threshold=0.2, min_seconds=0.01):
+    baseline_by_key = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline_by_key.get(result_key(result))
+        if base is None or max(result["seconds"], base["seconds"]) < min_seconds:
+            continue
+        if result["seconds"] > base["seconds"] * (1.0 + threshold):
+            regressions.append({"config": result_key(result), "seconds": result["seconds"], "baseline_seconds": base["seconds"]})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dodecahedron growth benchmarks.")
+    parser.add_argument("--output", help="write results to JSON file")
+    parser.add_argument("--n-iter", type=int, nargs="+", default=N_ITERS)
+    parser.add_argument("--face-grow-factor-per-iter", type=float, nargs="+", default=FACE_GROW_FACTORS_PER_ITER)
+    parser.add_argument("--prototypes", type=int, nargs="+", default=PROTOTYPE_COUNTS)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--blender", default=shutil.which("blender"), help="Blender executable for pipeline suite")
+    parser.add_argument("--instancing", choices=["objects", "points"], default="points")
+    parser.add_argument("--compare", help="previous results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = bench_growth(args.n_iter, args.face_grow_factor_per_iter, args.prototypes, repeats=args.repeats)
+    for result in results:
+        print("growth   n_iter={n_iter:2d} factor={face_grow_factor_per_iter:.2f} prototypes={n_prototypes:2d} elements={elements:7d} {seconds:8.4f}s".format(**result))
+    if args.blender:
+        pipeline_results = bench_pipeline(args.blender, args.n_iter, args.face_grow_factor_per_iter, args.prototypes, instancing=args.instancing)
+        for result in pipeline_results:
+            print("pipeline n_iter={n_iter:2d} factor={face_grow_factor_per_iter:.2f} prototypes={n_prototypes:2d} {seconds:8.4f}s".format(**result))
+        results.extend(pipeline_results)
+    else:
+        print("Blender not found, pipeline suite skipped.")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = find_regressions(results, json.load(f), threshold=args.threshold)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+#
+# Compact binary file of named NumPy arrays which can be memory-mapped.
+# Author: Lovro Bosnar
+#
+# Layout:
+#   magic (8 bytes) | header length (uint64, little endian) | JSON header | arrays
+# JSON header stores free-form metadata and dtype, shape and offset of each array.
+# Each array starts at an offset aligned to ALIGNMENT bytes so it can be memory-mapped directly.
+#
+
+import json
+
+import numpy as np
+
+MAGIC = b"DODECAF1"
+ALIGNMENT = 64
+
+def align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+# Write dict of arrays and metadata (JSON serializable dict) to path.
+def write_arrays(path, arrays, metadata={}):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    # Header size depends on offsets, so offsets are computed relative to the data start.
+    array_headers = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = align(offset)
+        array_headers[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+    header = json.dumps({"metadata": metadata, "arrays": array_headers}).encode("utf-8")
+    data_start = align(len(MAGIC) + 8 + len(header))
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + array_headers[name]["offset"])
+            f.write(array.tobytes())
+
+# Read metadata and arrays from path. If mmap, arrays are read-only memory maps and only touched slices are loaded.
+def read_arrays(path, mmap=True):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a dodecahedron growth array file: " + str(path))
+        header_length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    data_start = align(len(MAGIC) + 8 + header_length)
+    arrays = {}
+    for name, array_header in header["arrays"].items():
+        dtype = np.dtype(array_header["dtype"])
+        shape = tuple(array_header["shape"])
+        offset = data_start + array_header["offset"]
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        elif mmap:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+        else:
+            arrays[name] = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+    return header["metadata"], arrays
@@ -0,0 +1,170 @@
+#
+# Culling of grown elements before instancing: pure NumPy, no bpy/mathutils.
+# Author: Lovro Bosnar
+#
+# - occlusion: element is occluded if every outward face of it is covered by a placed neighbour. Face is covered
+#   if a point just in front of the face lies inside the inscribed sphere of another element.
+# - frustum: bounding sphere of element is tested against planes of the camera frustum.
+# - vanishing: scale of elements shrinks with every generation, elements of late generations can be far below any resolution.
+# Culled elements are only left out of instancing, grown structure stays complete.
+#
+
+import numpy as np
+
+import growth
+
+# Distance of the probe in front of a face, relative to element scale.
+PROBE_DISTANCE = 0.1
+# Elements smaller than this fraction of the largest element are never visible.
+MIN_RELATIVE_SCALE = 1e-6
+
+# Bool mask of points (P,3) which lie inside a sphere (centers (N,3), radii (N,)) other than the sphere of their owner (P,).
+# Spheres are split into bands of similar radius (powers of BAND_BASE). Each band is hashed in uniform grid with cell of
+# twice its largest radius, so each point visits 8 cells around it and cells of small elements stay sparse.
+def points_in_other_spheres(points, owners, centers, radii):
+    inside = np.zeros(len(points), dtype=bool)
+    if len(points) == 0 or len(centers) == 0:
+        return inside
+    # NOTE: radii of elements with vanishing scale are clamped, so grid cells stay representable.
+    bands = np.floor(np.log(np.maximum(radii, MIN_RELATIVE_RADIUS * radii.max())) / np.log(BAND_BASE)).astype(np.int64)
+    for band in np.unique(bands):
+        # Points already inside a sphere are not tested again.
+        pending = np.nonzero(~inside)[0]
+        hit = points_in_other_spheres_grid(points[pending], owners[pending], centers, radii, np.nonzero(bands == band)[0])
+        inside[pending[hit]] = True
+    return inside
+
+# Ratio of the largest and smallest radius in one band of `points_in_other_spheres()`.
+BAND_BASE = 4.0
+# Smallest radius relative to the largest one for grid cells.
+MIN_RELATIVE_RADIUS = 1e-9
+
+# Same as `points_in_other_spheres()` for given subset of spheres of similar radius.
+def points_in_other_spheres_grid(points, owners, centers, radii, spheres):
+    inside = np.zeros(len(points), dtype=bool)
+    # Cell of twice the largest radius: sphere containing a point has its center in one of 2x2x2 cells around the point.
+    cell_size = 2.0 * max(float(radii[spheres].max()), MIN_RELATIVE_RADIUS * float(radii.max()))
+    # Only points near the spheres of the band are tested.
+    near = np.nonzero(((points >= centers[spheres].min(axis=0) - cell_size) & (points <= centers[spheres].max(axis=0) + cell_size)).all(axis=1))[0]
+    primes = np.array([73856093, 19349663, 83492791], dtype=np.int64)
+    def cell_hash(cells):
+        return np.bitwise_xor.reduce(cells * primes, axis=1)
+    sphere_hashes = cell_hash(np.floor(centers[spheres] / cell_size).astype(np.int64))
+    order = spheres[np.argsort(sphere_hashes, kind="stable")]
+    sorted_hashes = np.sort(sphere_hashes, kind="stable")
+    point_coords = points[near] / cell_size
+    point_cells = np.floor(point_coords).astype(np.int64)
+    # Neighbouring cell on each axis is below or above, depending on the half of the cell the point is in.
+    directions = np.where(point_coords - point_cells < 0.5, -1, 1)
+    for offset in np.stack(np.meshgrid([0, 1], [0, 1], [0, 1], indexing="ij"), axis=-1).reshape(-1, 3):
+        hashes = cell_hash(point_cells + directions * offset)
+        starts = np.searchsorted(sorted_hashes, hashes, side="left")
+        counts = np.searchsorted(sorted_hashes, hashes, side="right") - starts
+        # Visit k-th sphere of each cell at once. Hash collisions only add candidates, distance test decides.
+        active = np.nonzero((counts > 0) & ~inside[near])[0]
+        k = 0
+        while len(active) > 0:
+            candidates = order[starts[active] + k]
+            point_idx = near[active]
+            hit = (candidates != owners[point_idx]) & (((points[point_idx] - centers[candidates]) ** 2).sum(axis=1) < radii[candidates] ** 2)
+            inside[point_idx[hit]] = True
+            k += 1
+            active = active[~hit & (counts[active] > k)]
+    return inside
+
+# Bool mask of elements (matrices (N,4,4)) whose outward faces are all covered by neighbours.
+# face_centers, face_normals, face_areas - face table of computational element, see `growth.grow_generations()`
+def occluded_elements(matrices, face_centers, face_normals, face_areas, probe_distance=PROBE_DISTANCE):
+    matrices = np.asarray(matrices, dtype=np.float64)
+    # Inscribed sphere is used for covering, so gaps between faces of neighbours do not count as cover.
+    radius = growth.element_radius(np.asarray(face_centers, dtype=np.float64), np.asarray(face_areas))
+    outward = np.asarray(face_areas) > growth.MIN_FACE_AREA
+    face_centers = np.asarray(face_centers, dtype=np.float64)[outward]
+    face_normals = np.asarray(face_normals, dtype=np.float64)[outward]
+    scales = growth.max_scale(matrices)
+    centers = matrices[:, :3, 3]
+    world_centers = np.einsum("nij,fj->nfi", matrices[:, :3, :3], face_centers) + centers[:, None, :]
+    world_normals = np.einsum("nij,fj->nfi", matrices[:, :3, :3], face_normals)
+    world_normals /= np.maximum(np.linalg.norm(world_normals, axis=2), 1e-12)[:, :, None]
+    probes = world_centers + world_normals * (probe_distance * scales)[:, None, None]
+    owners = np.repeat(np.arange(len(matrices)), len(face_centers))
+    covered = points_in_other_spheres(probes.reshape(-1, 3), owners, centers, radius * scales)
+    return covered.reshape(len(matrices), len(face_centers)).all(axis=1)
+
+# Planes (6,4) of camera frustum with normals pointing inside: n.x + d >= 0 for points inside.
+# camera_matrix - (4,4) camera to world transform, camera looks along its -Z axis
+# tan_half_fov_x, tan_half_fov_y - tangents of half of horizontal and vertical field of view
+def frustum_planes(camera_matrix, tan_half_fov_x, tan_half_fov_y, near=0.1, far=1000.0):
+    camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+    # Planes in camera space.
+    planes = np.array([
+        [1.0, 0.0, -tan_half_fov_x, 0.0],
+        [-1.0, 0.0, -tan_half_fov_x, 0.0],
+        [0.0, 1.0, -tan_half_fov_y, 0.0],
+        [0.0, -1.0, -tan_half_fov_y, 0.0],
+        [0.0, 0.0, -1.0, -near],
+        [0.0, 0.0, 1.0, far],
+    ])
+    planes /= np.linalg.norm(planes[:, :3], axis=1)[:, None]
+    # Plane p transforms to world space as p @ inverse(camera_matrix).
+    return planes @ np.linalg.inv(camera_matrix)
+
+# Bool mask of spheres which intersect the frustum.
+def spheres_in_frustum(centers, radii, planes):
+    distances = centers @ planes[:, :3].T + planes[:, 3]
+    return (distances >= -radii[:, None]).all(axis=1)
+
+# Cull elements of structure.
+# planes - frustum planes, see `frustum_planes()`, None disables frustum culling
+# occlusion - if True elements covered by neighbours are culled
+# radius - radius of bounding sphere of element with scale 1
+# Returns bool masks of culled elements and occluded elements (their lights are not visible either) and report with
+# number of removed elements.
+def cull(structure, face_centers, face_normals, face_areas, planes=None, occlusion=True, radius=1.0):
+    matrices = np.asarray(structure["matrices"], dtype=np.float64)
+    n_elements = len(matrices)
+    scales = growth.max_scale(matrices)
+    vanishing = scales < MIN_RELATIVE_SCALE * (scales.max() if n_elements > 0 else 0.0)
+    occluded = np.zeros(n_elements, dtype=bool)
+    outside = np.zeros(n_elements, dtype=bool)
+    if occlusion:
+        # Vanishing elements do not cover anything.
+        occluded[~vanishing] = occluded_elements(matrices[~vanishing], face_centers, face_normals, face_areas)
+    if planes is not None:
+        outside = ~spheres_in_frustum(matrices[:, :3, 3], radius * scales, planes)
+    culled = vanishing | occluded | outside
+    report = {
+        "elements": n_elements,
+        "vanishing": int(vanishing.sum()),
+        "occluded": int(occluded.sum()),
+        "outside_frustum": int(outside.sum()),
+        "culled": int(culled.sum()),
+        "visible": int(n_elements - culled.sum()),
+        "culled_fraction": float(culled.mean()) if n_elements > 0 else 0.0,
+    }
+    return culled, occluded, report
+
+# Structure with only elements in mask, for instancing.
+# Lights of removed elements are dropped, light elements and parents are reindexed (-1 for removed parents).
+# Per element "variation" and animation arrays are kept if present.
+# first_element - element index of first element in structure, when only part of a structure is given
+def select_elements(structure, mask, first_element=0):
+    new_index = np.cumsum(mask) - 1
+    selected = {key: np.asarray(structure[key])[mask] for key in ("matrices", "prototypes", "generations", "parents", "variation", "birth_frames", "grown_frames", "origins")
+                if key in structure}
+    parents = selected["parents"] - first_element
+    in_structure = (parents >= 0) & (parents < len(mask))
+    parent_kept = np.zeros(len(parents), dtype=bool)
+    parent_kept[in_structure] = mask[parents[in_structure]]
+    selected["parents"] = np.where(parent_kept, new_index[np.where(parent_kept, parents, 0)], -1)
+    light_elements = np.asarray(structure["light_elements"]) - first_element
+    light_kept = mask[light_elements]
+    selected["light_elements"] = new_index[light_elements[light_kept]]
+    selected["light_indices"] = np.asarray(structure["light_indices"])[light_kept]
+    return selected
+
+# Structure with lights of elements in mask removed, elements stay.
+def drop_lights(structure, mask, first_element=0):
+    light_elements = np.asarray(structure["light_elements"])
+    light_kept = ~mask[light_elements - first_element]
+    return dict(structure, light_elements=light_elements[light_kept], light_indices=np.asarray(structure["light_indices"])[light_kept])
@@ -1,4 +1,3 @@
-
 #
 # Blender 3.0/3.1
 # Author: Lovro Bosnar
@@ -10,10 +9,28 @@ import bmesh
 
 import mathutils
 
-from numpy.random import default_rng
-
 import math
+import argparse
 import copy
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+# Make sibling modules importable when run with `blender -P generative.py`.
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import culling
+import geometry
+import growth
+import growth_tree
+import light_placement
+import profiling
+import prototype_cache
+import structure_io
 
 # https://blender.stackexchange.com/questions/220072/check-using-name-if-a-collection-exists-in-blend-is-linked-to-scene
 def create_collection_if_not_exists(collection_name):
@@ -28,6 +45,7 @@ def create_instance(base_obj,
                     basis=mathutils.Matrix.Identity(4),
                     tbn=mathutils.Matrix.Identity(4),
                     collection_name=None):
+    profiling.add("create_instance")
     # Create instance.
     inst_obj = bpy.data.objects.new(base_obj.name+"_inst", base_obj.data)
     # Perform translation, rotation, scaling and moving to target coord system for instance.
@@ -46,22 +64,6 @@ def create_instance(base_obj,
         bpy.data.collections[collection_name].objects.link(inst_obj)
     return inst_obj
 
-# https://graphics.pixar.com/library/OrthonormalB/paper.pdf
-def pixar_onb(n):
-    t = mathutils.Vector((0,0,0))
-    b = mathutils.Vector((0,0,0))
-    if(n[2] < 0.0):
-        a = 1.0 / (1.0 - n[2])
-        b = n[0] * n[1] * a
-        t = mathutils.Vector((1.0 - n[0] * n[0] * a, -b, n[0]))
-        b = mathutils.Vector((b, n[1] * n[1] * a - 1.0, -n[1]))
-    else:
-        a = 1.0 / (1.0 + n[2])
-        b = -n[0] * n[1] * a
-        t = mathutils.Vector((1.0 - n[0] * n[0] * a, b, -n[0]))
-        b = mathutils.Vector((b, 1 - n[1] * n[1] * a, -n[1]))
-    return t, b
-
 def select_activate_only(objects=[]):
     for obj in bpy.data.objects:
         obj.select_set(False)
@@ -70,37 +72,53 @@ def select_activate_only(objects=[]):
         obj.select_set(True)
         bpy.context.view_layer.objects.active = obj
 
+# Atlas UVs of already unwrapped geometry, keyed by hash of mesh arrays.
+ATLAS_UV_CACHE = {}
+
+# Per face planar atlas UVs of mesh arrays, see `geometry.planar_atlas_uvs()`. Computed once per distinct geometry.
+def atlas_uvs(arrays):
+    geometry_hash = hashlib.sha1()
+    for key in ("vertices", "loop_vertices", "loop_starts", "loop_totals"):
+        geometry_hash.update(np.ascontiguousarray(arrays[key]).tobytes())
+    key = geometry_hash.hexdigest()
+    if key not in ATLAS_UV_CACHE:
+        ATLAS_UV_CACHE[key] = geometry.planar_atlas_uvs(arrays)
+    return ATLAS_UV_CACHE[key]
+
 # https://docs.blender.org/api/current/bpy.ops.uv.html
-# uv_projection_type = {"cube, "sphere", "smart"}
+# uv_projection_type = {"cube, "sphere", "atlas", "smart"}
+# "cube", "sphere" and "atlas" are computed on mesh data and do not depend on selection or mode, see `geometry.cube_project_uvs()`.
+# "smart" needs `bpy.ops.uv.smart_project()` in edit mode.
 def create_uv(base_obj, uv_projection_type="cube"):
-    # Select object.
-    select_activate_only([base_obj])
-    # Move from object mode to edit mode.
-    bpy.ops.object.mode_set(mode='EDIT')
-    # Peform UV unwrap.
-    bpy.ops.mesh.select_all(action='SELECT')
-    if uv_projection_type == "cube":
-        bpy.ops.uv.cube_project()
-    if uv_projection_type == "sphere":
-        bpy.ops.uv.sphere_project()
     if uv_projection_type == "smart":
+        # Select object.
+        select_activate_only([base_obj])
+        # Move from object mode to edit mode.
+        bpy.ops.object.mode_set(mode='EDIT')
+        # Peform UV unwrap.
+        bpy.ops.mesh.select_all(action='SELECT')
         bpy.ops.uv.smart_project()
-    # Move from edit mode to object mode.
-    bpy.ops.object.mode_set(mode='OBJECT')
-
+        # Move from edit mode to object mode.
+        bpy.ops.object.mode_set(mode='OBJECT')
+        return
+    mesh = base_obj.data
+    arrays = mesh_arrays(mesh)
+    loop_coords = arrays["vertices"][arrays["loop_vertices"]]
+    if uv_projection_type == "cube":
+        normals = np.empty(len(mesh.polygons) * 3, dtype=np.float32)
+        mesh.polygons.foreach_get("normal", normals)
+        uvs = geometry.cube_project_uvs(loop_coords, np.repeat(normals.reshape(-1, 3), arrays["loop_totals"], axis=0))
+    if uv_projection_type == "sphere":
+        uvs = geometry.sphere_project_uvs(loop_coords)
+    if uv_projection_type == "atlas":
+        uvs = atlas_uvs(arrays)
+    uv_layer = mesh.uv_layers.active or mesh.uv_layers.new(name="UVMap")
+    uv_layer.data.foreach_set("uv", np.ascontiguousarray(uvs, dtype=np.float32).ravel())
 
 def remove_list(list_of_objects):
     for curr_object in list_of_objects:
         bpy.data.objects.remove(curr_object, do_unlink=True)
 
-def boolean_difference(with_object):
-    bpy.ops.object.modifier_add(type="BOOLEAN")
-    bpy.context.object.modifiers["Boolean"].operation = "DIFFERENCE"
-    bpy.context.object.modifiers["Boolean"].object = with_object
-    bpy.context.object.modifiers["Boolean"].solver = "EXACT" # TODO: approx?
-    bpy.context.object.modifiers["Boolean"].use_self = False
-    bpy.ops.object.modifier_apply(modifier="Boolean")
-
 def create_icosphere(radius=1.0):
     bm = bmesh.new()
     # Create icosphere.
@@ -116,7 +134,9 @@ def create_icosphere(radius=1.0):
 # Create shader for given material.
 # https://vividfax.github.io/2021/01/14/blender-materials.html
 # shader_type = {"glossy", "diffuse", "glass"}
-def create_shader(dest_mat, shader_type="glossy", color=(0.8, 0.54519, 0.224999, 1), roughness=0.2, ior=1.45):
+# variation_color - if given, color is mixed towards it by "variation" attribute of the instance (or object property),
+# so one material serves all elements, see `element_variation()`
+def create_shader(dest_mat, shader_type="glossy", color=(0.8, 0.54519, 0.224999, 1), roughness=0.2, ior=1.45, variation_color=None):
 
     # Obtain shader nodes and links.
     nodes = dest_mat.node_tree.nodes
@@ -138,11 +158,37 @@ def create_shader(dest_mat, shader_type="glossy", color=(0.8, 0.54519, 0.224999,
         nodes["Glass BSDF"].inputs[1].default_value = roughness
         nodes["Glass BSDF"].inputs[2].default_value = ior
 
+    # Per instance color variation.
+    # "Instancer" attribute is read from geometry nodes instances and falls back to custom property of the object.
+    # https://docs.blender.org/manual/en/latest/render/shader_nodes/input/attribute.html
+    if variation_color is not None:
+        attribute = nodes.new(type='ShaderNodeAttribute')
+        attribute.attribute_type = 'INSTANCER'
+        attribute.attribute_name = "variation"
+        mix = nodes.new(type='ShaderNodeMixRGB')
+        mix.inputs["Color1"].default_value = color
+        mix.inputs["Color2"].default_value = variation_color
+        links.new(attribute.outputs["Fac"], mix.inputs["Fac"])
+        links.new(mix.outputs["Color"], shader.inputs[0])
+
     # Create links.
     links.new(shader.outputs[0], output.inputs[0])
 
-# Create material, create shader and assign it to the object.
-def assign_new_material(base_obj, shader_type, color, roughness, ior, mat_name):
+# Materials by shader parameters, see `get_material()`.
+MATERIAL_CACHE = {}
+
+# Material with given shader parameters, created only if there is no such material yet.
+def get_material(shader_type, color, roughness, ior, mat_name, variation_color=None):
+    key = (shader_type, tuple(color), roughness, ior, tuple(variation_color) if variation_color is not None else None)
+    mat = MATERIAL_CACHE.get(key)
+    if mat is not None:
+        # NOTE: cached material can be removed from blend data meanwhile, then any access to it raises ReferenceError.
+        try:
+            if bpy.data.materials.get(mat.name) == mat:
+                return mat
+        except ReferenceError:
+            pass
+        del MATERIAL_CACHE[key]
     # Create new material.
     mat = bpy.data.materials.new(name=mat_name)
     # Create Shader.
@@ -150,11 +196,23 @@ def assign_new_material(base_obj, shader_type, color, roughness, ior, mat_name):
     if mat.node_tree:
         mat.node_tree.links.clear()
         mat.node_tree.nodes.clear()
-    create_shader(mat, shader_type, color, roughness, ior)
+    create_shader(mat, shader_type, color, roughness, ior, variation_color=variation_color)
+    MATERIAL_CACHE[key] = mat
+    return mat
+
+# Get material with shader parameters and assign it to the object.
+def assign_new_material(base_obj, shader_type, color, roughness, ior, mat_name):
     # Assign material to object.
-    base_obj.data.materials.append(mat)
+    base_obj.data.materials.append(get_material(shader_type, color, roughness, ior, mat_name))
 
-def create_penta_sphere(radius=1.0, location=mathutils.Vector((0,0,0)), name="penta_sphere", shader_type="glossy", color=(1,1,1,1), roughness=0.2, ior=1.45):
+# Replace materials of objects with the material.
+def replace_material(objects, mat):
+    for obj in objects:
+        obj.data.materials.clear()
+        obj.data.materials.append(mat)
+
+# Create pentasphere bmesh in the world origin.
+def create_penta_sphere_bmesh():
     bm = bmesh.new()
     # Create icosphere.
     # https://docs.blender.org/api/current/bmesh.ops.html#bmesh.ops.create_icosphere
@@ -166,6 +224,10 @@ def create_penta_sphere(radius=1.0, location=mathutils.Vector((0,0,0)), name="pe
     bmesh.ops.bevel(bm, geom=(bm.edges), offset=0.29, affect="EDGES")
     # Obtain "clean" pentasphere while bevel introduces additional vertices!
     bmesh.ops.remove_doubles(bm, verts=bm.verts, dist=0.05)
+    return bm
+
+def create_penta_sphere(radius=1.0, location=mathutils.Vector((0,0,0)), name="penta_sphere", shader_type="glossy", color=(1,1,1,1), roughness=0.2, ior=1.45):
+    bm = create_penta_sphere_bmesh()
     # TODO: remove close vertices!
     object_mesh = bpy.data.meshes.new(name + "_mesh")
     bm.to_mesh(object_mesh)
@@ -174,104 +236,149 @@ def create_penta_sphere(radius=1.0, location=mathutils.Vector((0,0,0)), name="pe
     bpy.context.collection.objects.link(obj)
     obj.location = location
     assign_new_material(base_obj=obj, shader_type=shader_type, color=color, roughness=roughness, ior=ior, mat_name=name+"_material")
-    create_uv(obj, uv_projection_type="smart")
+    create_uv(obj, uv_projection_type="atlas")
     return obj
 
 # Create pentasphere with extruded faces.
 # Create base element where main element of base element is scale=1
 def create_penta_sphere_extruded(location=mathutils.Vector((0,0,0)), name="penta_sphere_extruded", shader_type="glossy", color=(1,1,1,1), roughness=0.2, ior=1.45):
-    penta_sphere_main = create_penta_sphere(radius=1.0, name=name, location=mathutils.Vector((0,0,0)), shader_type=shader_type, color=color, roughness=roughness, ior=ior)
+    bm = create_penta_sphere_bmesh()
     # For penta sphere of radius = 1.0, we need to create icosphere of 0.93...
-    bm = bmesh.new()
-    bmesh.ops.create_icosphere(bm, subdivisions=1, radius=0.93, matrix=mathutils.Matrix.Identity(4), calc_uvs=False)
+    bm_detail = bmesh.new()
+    bmesh.ops.create_icosphere(bm_detail, subdivisions=1, radius=0.93, matrix=mathutils.Matrix.Identity(4), calc_uvs=False)
     # And bevel its edges for 0.22 to obtain penta mesh detail.
-    bmesh.ops.bevel(bm, geom=(bm.edges), offset=0.22, affect="EDGES")
-    # Finally, make a mesh object from bmesh.
+    bmesh.ops.bevel(bm_detail, geom=(bm_detail.edges), offset=0.22, affect="EDGES")
+    # Join detail into main pentasphere bmesh instead of `bpy.ops.object.join()`.
     detail_mesh = bpy.data.meshes.new("detail_mesh")
-    bm.to_mesh(detail_mesh)
-    # TODO: assign material!
-    detail_obj = bpy.data.objects.new("detail_obj", detail_mesh)
-    bpy.context.collection.objects.link(detail_obj)
+    bm_detail.to_mesh(detail_mesh)
+    bm_detail.free()
+    bm.from_mesh(detail_mesh)
+    bpy.data.meshes.remove(detail_mesh)
+    object_mesh = bpy.data.meshes.new(name + "_mesh")
+    bm.to_mesh(object_mesh)
     bm.free()
-    base_elem1_name = penta_sphere_main.name 
-    select_activate_only([detail_obj, penta_sphere_main]) # join takes the name of the last selected and also its material!
-    bpy.ops.object.join()
-    obj = bpy.context.scene.objects[base_elem1_name]
+    obj = bpy.data.objects.new(name + "_obj", object_mesh)
+    bpy.context.collection.objects.link(obj)
+    obj.location = location
+    assign_new_material(base_obj=obj, shader_type=shader_type, color=color, roughness=roughness, ior=ior, mat_name=name+"_material")
+    create_uv(obj, uv_projection_type="atlas")
+    return obj
+
+# Vertices (V,3) and pentagonal faces (12,5) of pentasphere, small faces left after merging vertices are skipped.
+def penta_sphere_pentagons():
+    bm = create_penta_sphere_bmesh()
+    bm.verts.index_update()
+    pentagons = [[v.index for v in face.verts] for face in bm.faces if face.calc_area() > growth.MIN_FACE_AREA]
+    vertices = np.array([v.co[:] for v in bm.verts])
+    bm.free()
+    if any(len(pentagon) != 5 for pentagon in pentagons):
+        raise ValueError("Pentasphere faces are not pentagons, check bevel offset in create_penta_sphere_bmesh()")
+    return vertices, np.array(pentagons)
+
+# Create base element object from mesh arrays.
+def create_object_from_arrays(arrays, location=mathutils.Vector((0,0,0)), name="penta_sphere", shader_type="glossy", color=(1,1,1,1), roughness=0.2, ior=1.45):
+    obj = bpy.data.objects.new(name + "_obj", mesh_from_arrays(name + "_mesh", arrays))
+    bpy.context.collection.objects.link(obj)
     obj.location = location
-    create_uv(obj, uv_projection_type="smart")
+    assign_new_material(base_obj=obj, shader_type=shader_type, color=color, roughness=roughness, ior=ior, mat_name=name+"_material")
     return obj
 
 # Create pentasphere with hollow faces.
 # Create base element where main element of base element is scale=1
-def create_penta_sphere_hollow(location=mathutils.Vector((0,0,0)), name="penta_sphere_hollow", shader_type="glossy", color=(1,1,1,1), roughness=0.2, ior=1.45):
-    # Create main penta sphere.
-    penta_sphere_main = create_penta_sphere(radius=1.0, location=mathutils.Vector((0,0,0)), name=name, shader_type=shader_type, color=color, roughness=roughness, ior=ior)
-    # For main penta sphere of radius = 1.0, we need to create icosphere of 0.85...
-    bm = bmesh.new()
-    bmesh.ops.create_icosphere(bm, subdivisions=1, radius=0.85, matrix=mathutils.Matrix.Identity(4), calc_uvs=False)
-    # And bevel its edges for 0.16 to obtain penta mesh detail.
-    bmesh.ops.bevel(bm, geom=(bm.edges), offset=0.16, affect="EDGES")
-    # Finally, make a mesh object from bmesh.
-    detail_mesh = bpy.data.meshes.new("detail_mesh")
-    bm.to_mesh(detail_mesh)
-    detail_obj = bpy.data.objects.new("detail_obj", detail_mesh)
-    bpy.context.collection.objects.link(detail_obj)
-    bm.free()
-    select_activate_only([penta_sphere_main])
-    boolean_difference(detail_obj)
-    bpy.data.objects.remove(detail_obj, do_unlink=True)
-    penta_sphere_main.location = location
-    create_uv(penta_sphere_main, uv_projection_type="smart")
-    return penta_sphere_main
-
-# https://blender.stackexchange.com/questions/115397/extrude-in-python
-# https://docs.blender.org/api/current/bmesh.ops.html
+# Holes are built directly, see `geometry.hollow_penta_sphere()`. Previously boolean difference with icosphere of 0.85
+# beveled for 0.16 was used, hole_size=0.7 gives visually matching frame.
+def create_penta_sphere_hollow(location=mathutils.Vector((0,0,0)), name="penta_sphere_hollow", hole_size=0.7, tunnels=True, shader_type="glossy", color=(1,1,1,1), roughness=0.2, ior=1.45):
+    vertices, pentagons = penta_sphere_pentagons()
+    arrays = geometry.hollow_penta_sphere(vertices, pentagons, hole_size=hole_size, tunnels=tunnels)
+    arrays["uvs"] = atlas_uvs(arrays)
+    obj = create_object_from_arrays(arrays, location=location, name=name, shader_type=shader_type, color=color, roughness=roughness, ior=ior)
+    return obj
+
 # hollow_size [0,1]
-def create_penta_sphere_hollow2(location=mathutils.Vector((0,0,0)), name="penta_sphere_hollow2", hole_size=0.5, hole_scale=0.1, shader_type="glossy", color=(1,1,1,1), roughness=0.2, ior=1.45):
+# Pentasphere with holes of hole_size through each face, built without boolean solver, see `geometry.hollow_penta_sphere()`.
+# tunnels - if False, holes are not continued to the inner pentasphere, see `geometry.hollow_penta_sphere()`
+def create_penta_sphere_hollow2(location=mathutils.Vector((0,0,0)), name="penta_sphere_hollow2", hole_size=0.5, tunnels=True, shader_type="glossy", color=(1,1,1,1), roughness=0.2, ior=1.45):
     # NOTE: calculations of geometry are done in (0,0,0) with scale 1! Later object is transformed.
-    # Create base pentasphere.
-    base_obj=create_penta_sphere(radius=1.0, location=mathutils.Vector((0,0,0)), name=name, shader_type=shader_type, color=color, roughness=roughness, ior=ior)
-    #  Create detail pentasphere.
-    bm = bmesh.new()
-    # Create icosphere.
-    # https://docs.blender.org/api/current/bmesh.ops.html#bmesh.ops.create_icosphere
-    bmesh.ops.create_icosphere(bm, subdivisions=1, radius=1, matrix=mathutils.Matrix.Identity(4), calc_uvs=False)
-    # From icosphere create pentasphere.
-    # https://blender.stackexchange.com/a/780
-    # https://en.wikipedia.org/wiki/Dual_polyhedron
-    # For icosphere of radius=1, edges must be beveled in range [0.29,0.3] so we obtain pentasphere!
-    bmesh.ops.bevel(bm, geom=(bm.edges), offset=0.3, affect="EDGES")
-    # Obtain "clean" pentasphere while bevel introduces additional vertices!
-    bmesh.ops.remove_doubles(bm, verts=bm.verts, dist=0.05)
-    # Extrude faces in normal direction
-    efaces = bmesh.ops.extrude_discrete_faces(bm, faces=bm.faces)
-    for eface in efaces["faces"]:
-        bmesh.ops.translate(bm,verts=eface.verts,vec=eface.normal*6.0)
-    # Scale faces in place.
-    # https://blender.stackexchange.com/questions/121123/using-python-and-bmesh-to-scale-resize-a-face-in-place
-    """
-    for face in bm.faces:
-        face_center = face.calc_center_median()
-        for v in face.verts:
-            #v.co = face_center + hole_scale * (v.co - face_center)
-            v_offset_dir = (v.co - face_center)
-            v_offset_dir.normalize()
-            v.co = v.co + hole_scale * v_offset_dir
-    """
-    # Create mesh object from bmesh.
-    detail_mesh = bpy.data.meshes.new("detail_mesh")
-    bm.to_mesh(detail_mesh)
-    detail_obj = bpy.data.objects.new("detail_obj", detail_mesh)
-    detail_obj.scale = mathutils.Vector((hole_size,hole_size,hole_size)) # [0.1, 0.8] - see the extrude length
-    bpy.context.collection.objects.link(detail_obj)
-    bm.free()
-    # Perform boolean difference.
-    select_activate_only([base_obj])
-    boolean_difference(detail_obj)
-    bpy.data.objects.remove(detail_obj, do_unlink=True)
-    base_obj.location = location
-    create_uv(base_obj, uv_projection_type="smart")
-    return base_obj
+    vertices, pentagons = penta_sphere_pentagons()
+    arrays = geometry.hollow_penta_sphere(vertices, pentagons, hole_size=hole_size, tunnels=tunnels)
+    arrays["uvs"] = atlas_uvs(arrays)
+    obj = create_object_from_arrays(arrays, location=location, name=name, shader_type=shader_type, color=color, roughness=roughness, ior=ior)
+    return obj
+
+# Vertex, face and UV arrays of mesh.
+def mesh_arrays(mesh):
+    vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", vertices)
+    loop_vertices = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    loop_starts = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    arrays = {"vertices": vertices.reshape(-1, 3), "loop_vertices": loop_vertices, "loop_starts": loop_starts, "loop_totals": loop_totals}
+    if mesh.uv_layers.active:
+        uvs = np.empty(len(mesh.loops) * 2, dtype=np.float32)
+        mesh.uv_layers.active.data.foreach_get("uv", uvs)
+        arrays["uvs"] = uvs.reshape(-1, 2)
+    return arrays
+
+# Create mesh from vertex, face and UV arrays.
+def mesh_from_arrays(name, arrays):
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(arrays["vertices"]))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(arrays["vertices"], dtype=np.float32).ravel())
+    mesh.loops.add(len(arrays["loop_vertices"]))
+    mesh.loops.foreach_set("vertex_index", np.ascontiguousarray(arrays["loop_vertices"], dtype=np.int32))
+    mesh.polygons.add(len(arrays["loop_starts"]))
+    mesh.polygons.foreach_set("loop_start", np.ascontiguousarray(arrays["loop_starts"], dtype=np.int32))
+    mesh.polygons.foreach_set("loop_total", np.ascontiguousarray(arrays["loop_totals"], dtype=np.int32))
+    mesh.update(calc_edges=True)
+    if "uvs" in arrays:
+        uv_layer = mesh.uv_layers.new(name="UVMap")
+        uv_layer.data.foreach_set("uv", np.ascontiguousarray(arrays["uvs"], dtype=np.float32).ravel())
+    return mesh
+
+# Create base element with generator or load its mesh from prototype cache.
+# generator - one of create_penta_sphere* functions
+# geometry_params - dict of generator parameters which define geometry e.g. {"hole_size": 0.1}
+# cache_dir - directory of prototype cache, if None cache is not used
+def create_prototype(generator, geometry_params={}, location=mathutils.Vector((0,0,0)), name="penta_sphere", shader_type="glossy", color=(1,1,1,1), roughness=0.2, ior=1.45, cache_dir=None):
+    if cache_dir is None:
+        with profiling.phase("prototype_build:" + generator.__name__):
+            return generator(location=location, name=name, shader_type=shader_type, color=color, roughness=roughness, ior=ior, **geometry_params)
+    key = prototype_cache.prototype_key(generator.__name__, geometry_params)
+    arrays = prototype_cache.load_prototype(cache_dir, key)
+    if arrays is None:
+        with profiling.phase("prototype_build:" + generator.__name__):
+            obj = generator(location=location, name=name, shader_type=shader_type, color=color, roughness=roughness, ior=ior, **geometry_params)
+            prototype_cache.save_prototype(cache_dir, key, mesh_arrays(obj.data), {"generator": generator.__name__, "params": geometry_params})
+        return obj
+    # Rehydrate cached mesh, modelling is skipped entirely.
+    with profiling.phase("prototype_cache_load:" + generator.__name__):
+        return create_object_from_arrays(arrays, location=location, name=name, shader_type=shader_type, color=color, roughness=roughness, ior=ior)
+
+# Generators and parameters of detail levels of prototype, from full detail down to plain pentasphere proxy.
+def prototype_lods(generator, geometry_params={}):
+    if generator in (create_penta_sphere_hollow, create_penta_sphere_hollow2):
+        return [(generator, geometry_params), (generator, dict(geometry_params, tunnels=False)), (create_penta_sphere, {})]
+    if generator == create_penta_sphere:
+        return [(generator, geometry_params)]
+    return [(generator, geometry_params), (create_penta_sphere, {})]
+
+# Display elements of structure with prototypes replaced by their detail levels, see `growth.select_lods()`.
+# lods - dict: "elements" - list of all detail level objects, "table" (n_prototypes, n_levels) - index of level object
+# in "elements" for each prototype, prototypes with fewer levels repeat the coarsest one, "thresholds", "mode",
+# "camera_matrix", "focal_length" - arguments of `growth.select_lods()`
+# Returns structure and base elements to instance, unchanged if lods is None.
+def lod_structure(structure, base_elements, lods=None):
+    if lods is None:
+        return structure, base_elements
+    with profiling.phase("select_lods") as record:
+        record["elements"] = len(structure["matrices"])
+        levels = growth.select_lods(structure, lods["thresholds"], mode=lods["mode"], camera_matrix=lods["camera_matrix"], focal_length=lods["focal_length"])
+        table = np.asarray(lods["table"])
+        prototypes = table[structure["prototypes"], np.minimum(levels, table.shape[1] - 1)]
+    return dict(structure, prototypes=prototypes), lods["elements"]
 
 def create_point_light(location=mathutils.Vector((0,0,0)), color=mathutils.Vector((0.823102, 0.285278, 0.118767)), intensity=20.0):
     # Create new light datablock.
@@ -297,163 +404,794 @@ def triangulate(obj):
     bm.free()  # free and prevent further access
 
 #
-# barycentric sampling of triangulated mesh using object.data (mesh)
+# barycentric sampling of mesh using object.data (mesh)
 # object.data (mesh) has extensive info on vertices (e.g. weight, color, etc.)
 #
-# NOTE: base_obj must be triangulated!
+# Mesh data is read into arrays and sampled at once, see `geometry.sample_triangles()`. Loop triangles are used, so
+# base_obj does not have to be triangulated. Samples are distributed by triangle area times vertex weight.
+# n_samples - average number of samples per triangle
+# Returns arrays: positions (n,3), normals (n,3), weights (n,), tbn (n,4,4)
 #
-def vertex_weighted_barycentric_sampling(base_obj, n_samples):
-    samples = [] # (p, N, w, tbn)
-    for polygon in base_obj.data.polygons: # must be triangulated mesh!
-        triangle_vertices = []
-        triangle_vertex_weights = []
-        for v_idx in polygon.vertices:
-            v = base_obj.data.vertices[v_idx]
-            triangle_vertices.append(v.co)
-            if len(v.groups) < 1:
-                triangle_vertex_weights.append(0.0)
-            else:
-                triangle_vertex_weights.append(v.groups[0].weight) # TODO: only one group? Investigate! float in [0, 1], default 0.0
-        for i in range(n_samples):
-            # Find sample using barycentric sampling.
-            a = mathutils.noise.random()
-            b = mathutils.noise.random()
-            c = mathutils.noise.random()
-            s = a + b + c
-            un = (a / s)
-            vn = (b / s)
-            wn = (c / s)
-            w = un * triangle_vertex_weights[0] + vn * triangle_vertex_weights[1] + wn * triangle_vertex_weights[2] # interpolate weight
-            if w > 0.01: # an precision error otherwise?
-                p = un * triangle_vertices[0] + vn * triangle_vertices[1] + wn * triangle_vertices[2]
-                n = polygon.normal # TODO: vertex normals?
-                # Calc tangent. NOTE: use most distant point from barycentric coord to evade problems with 0
-                t = mathutils.Vector(triangle_vertices[0] - p)
-                t = t.normalized()
-                bt = n.cross(t)
-                bt = bt.normalized()
-                tbn = mathutils.Matrix((t, bt, n)) # NOTE: using pixar_onb()?
-                tbn = tbn.transposed() # TODO: why transposing?
-                tbn.resize_4x4()
-                samples.append((p,n,w,tbn))
-    return samples 
+def vertex_weighted_barycentric_sampling(base_obj, n_samples, rng=None):
+    mesh = base_obj.data
+    mesh.calc_loop_triangles()
+    vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", vertices)
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", triangles)
+    normals = np.empty(len(mesh.loop_triangles) * 3, dtype=np.float32)
+    mesh.loop_triangles.foreach_get("normal", normals) # TODO: vertex normals?
+    # NOTE: vertex groups are not exposed to foreach_get, so weights are read once per vertex.
+    weights = np.array([v.groups[0].weight if len(v.groups) > 0 else 0.0 for v in mesh.vertices]) # TODO: only one group? Investigate! float in [0, 1], default 0.0
+    positions, normals, weights, tbn = geometry.sample_triangles(vertices.reshape(-1, 3), triangles.reshape(-1, 3), normals.reshape(-1, 3), weights,
+                                                                 n_samples * len(mesh.loop_triangles), rng=rng)
+    keep = weights > 0.01 # an precision error otherwise?
+    return positions[keep], normals[keep], weights[keep], tbn[keep]
+
+
+# Create display elem object for each element of grown structure (or its generation) in according collection for its base element.
+# Starting display elem stays in the active collection.
+# Variation of elements (see `element_variation()`) is stored as "variation" custom property of each instance.
+# Elements with birth frames (see `animation_structure()`) are animated, see `animate_objects()`.
+def instance_objects(structure, base_elements, first_element=0):
+    with profiling.phase("instance_objects") as record:
+        record["elements"] = len(structure["matrices"])
+        variation = structure.get("variation")
+        objects = []
+        for elem_i, (matrix, prototype) in enumerate(zip(structure["matrices"], structure["prototypes"]), start=first_element):
+            base_elem = base_elements[prototype]
+            inst_obj = create_instance(base_elem, basis=mathutils.Matrix(matrix.tolist()), collection_name=base_elem.name if elem_i > 0 else None)
+            if variation is not None:
+                inst_obj["variation"] = float(variation[elem_i - first_element])
+            objects.append(inst_obj)
+    if "birth_frames" in structure:
+        animate_objects(objects, structure)
+
+# Keyframe growth of objects from origin to full size between birth and grown frame of their elements.
+# F-curves are built in bulk with `keyframe_points.add()` and `foreach_set()` instead of `keyframe_insert()` per key.
+def animate_objects(objects, structure):
+    with profiling.phase("animate_objects") as record:
+        record["elements"] = len(objects)
+        locations, rotations, scales = growth.decompose(np.asarray(structure["matrices"], dtype=np.float64))
+        for obj, birth_frame, grown_frame, origin, location, scale in zip(objects, structure["birth_frames"], structure["grown_frames"], structure["origins"], locations, scales):
+            action = bpy.data.actions.new(obj.name + "_growth")
+            obj.animation_data_create().action = action
+            for data_path, start_values, end_values in (("location", origin, location), ("scale", np.zeros(3), scale)):
+                for axis in range(3):
+                    fcurve = action.fcurves.new(data_path, index=axis)
+                    fcurve.keyframe_points.add(2)
+                    fcurve.keyframe_points.foreach_set("co", np.array([birth_frame, start_values[axis], grown_frame, end_values[axis]], dtype=np.float32))
+                    fcurve.update()
+
+# Create point light copy for each light of grown structure (or its generation) in collection of its element's base element.
+# Lights are grouped by base element, so each collection is looked up once, and copies are only created, placed and linked
+# instead of going through `create_instance()`.
+def instance_lights(structure, base_elements, lights, first_element=0):
+    with profiling.phase("instance_lights") as record:
+        record["elements"] = len(structure["light_elements"])
+        elements = np.asarray(structure["light_elements"], dtype=np.int64) - first_element
+        light_indices = np.asarray(structure["light_indices"], dtype=np.int64)
+        prototypes = np.asarray(structure["prototypes"])[elements]
+        locations = np.asarray(structure["matrices"])[elements, :3, 3]
+        for prototype in np.unique(prototypes):
+            collection_name = base_elements[prototype].name
+            create_collection_if_not_exists(collection_name)
+            collection_objects = bpy.data.collections[collection_name].objects
+            in_collection = prototypes == prototype
+            for light_i, location in zip(light_indices[in_collection].tolist(), locations[in_collection].tolist()):
+                light_object = bpy.data.objects.new(lights[light_i].name + "_inst", lights[light_i].data)
+                light_object.location = location
+                collection_objects.link(light_object)
+
+# Create lights of grown structure merged into at most max_lights lights, see `light_placement.py`.
+# Merged lights are new light datablocks with summed energy and energy-weighted color, in collection of given name.
+# Returns clustering report with energy and irradiance error.
+def instance_clustered_lights(structure, lights, max_lights, first_element=0, name="growth_lights"):
+    with profiling.phase("instance_clustered_lights") as record:
+        positions, energies = light_placement.light_candidates(structure, [light.data.energy for light in lights], first_element=first_element)
+        light_positions, light_energies, light_radii, labels, cell_size = light_placement.cluster_lights(positions, energies, max_lights)
+        colors = np.array([light.data.color[:] for light in lights]).reshape(-1, 3)[structure["light_indices"]]
+        # Candidates dropped by a budget of 0 lights have no cluster.
+        kept = labels >= 0
+        light_colors = light_placement.cluster_means(colors[kept], energies[kept], labels[kept], len(light_positions))
+        report = light_placement.clustering_report(positions, energies, labels, light_positions, light_energies, samples=structure["matrices"][:, :3, 3])
+        report["cell_size"] = cell_size
+        create_collection_if_not_exists(name)
+        for location, energy, radius, color in zip(light_positions, light_energies, light_radii, light_colors):
+            light_data = bpy.data.lights.new(name=name + "_data", type='POINT')
+            light_data.energy = energy
+            light_data.color = color
+            # Merged light covers its candidates with soft shadows.
+            light_data.shadow_soft_size = max(light_data.shadow_soft_size, radius)
+            light_object = bpy.data.objects.new(name=name + "_object", object_data=light_data)
+            light_object.location = location
+            bpy.data.collections[name].objects.link(light_object)
+        record["elements"] = len(light_positions)
+    print("Lights: {candidates} candidates merged into {lights}, mean displacement {mean_displacement:.3f}, irradiance error {irradiance_error:.3f}".format(**report))
+    return report
+
+# Geometry nodes tree which instances children of a collection on points.
+# Rotation, scale and instance index are given as group inputs so the modifier can read them from point attributes.
+# https://docs.blender.org/manual/en/latest/modeling/geometry_nodes/instances/instance_on_points.html
+# animated - if True, each point grows from its origin to full size between its birth and grown frame:
+# t = clamp((frame - birth) / (grown - birth)), position = origin + t * (position - origin), scale = t * scale
+def create_points_instancer_node_group(prototype_collection, name="points_instancer", animated=False):
+    node_group = bpy.data.node_groups.new(name, "GeometryNodeTree")
+    node_group.inputs.new("NodeSocketGeometry", "Geometry")
+    node_group.inputs.new("NodeSocketVector", "Rotation")
+    node_group.inputs.new("NodeSocketVector", "Scale")
+    node_group.inputs.new("NodeSocketInt", "Prototype")
+    if animated:
+        node_group.inputs.new("NodeSocketFloat", "Birth Frame")
+        node_group.inputs.new("NodeSocketFloat", "Grown Frame")
+        node_group.inputs.new("NodeSocketVector", "Origin")
+    node_group.outputs.new("NodeSocketGeometry", "Geometry")
+    nodes = node_group.nodes
+    links = node_group.links
+    group_input = nodes.new("NodeGroupInput")
+    group_output = nodes.new("NodeGroupOutput")
+    # NOTE: separate children are sorted alphabetically, see `instance_points()`.
+    collection_info = nodes.new("GeometryNodeCollectionInfo")
+    collection_info.inputs["Collection"].default_value = prototype_collection
+    collection_info.inputs["Separate Children"].default_value = True
+    collection_info.inputs["Reset Children"].default_value = True # base elements are placed away from the origin
+    instance_on_points = nodes.new("GeometryNodeInstanceOnPoints")
+    instance_on_points.inputs["Pick Instance"].default_value = True
+    links.new(collection_info.outputs[0], instance_on_points.inputs["Instance"])
+    links.new(group_input.outputs["Prototype"], instance_on_points.inputs["Instance Index"])
+    links.new(group_input.outputs["Rotation"], instance_on_points.inputs["Rotation"])
+    links.new(instance_on_points.outputs["Instances"], group_output.inputs["Geometry"])
+    if not animated:
+        links.new(group_input.outputs["Geometry"], instance_on_points.inputs["Points"])
+        links.new(group_input.outputs["Scale"], instance_on_points.inputs["Scale"])
+        return node_group
+    # Growth parameter t of each point from scene frame.
+    scene_time = nodes.new("GeometryNodeInputSceneTime")
+    age = nodes.new("ShaderNodeMath")
+    age.operation = "SUBTRACT"
+    links.new(scene_time.outputs["Frame"], age.inputs[0])
+    links.new(group_input.outputs["Birth Frame"], age.inputs[1])
+    duration = nodes.new("ShaderNodeMath")
+    duration.operation = "SUBTRACT"
+    links.new(group_input.outputs["Grown Frame"], duration.inputs[0])
+    links.new(group_input.outputs["Birth Frame"], duration.inputs[1])
+    t = nodes.new("ShaderNodeMath")
+    t.operation = "DIVIDE"
+    t.use_clamp = True
+    links.new(age.outputs[0], t.inputs[0])
+    links.new(duration.outputs[0], t.inputs[1])
+    # Move points from origin towards their position.
+    position = nodes.new("GeometryNodeInputPosition")
+    offset = nodes.new("ShaderNodeVectorMath")
+    offset.operation = "SUBTRACT"
+    links.new(position.outputs["Position"], offset.inputs[0])
+    links.new(group_input.outputs["Origin"], offset.inputs[1])
+    scaled_offset = nodes.new("ShaderNodeVectorMath")
+    scaled_offset.operation = "SCALE"
+    links.new(offset.outputs["Vector"], scaled_offset.inputs[0])
+    links.new(t.outputs[0], scaled_offset.inputs["Scale"])
+    grown_position = nodes.new("ShaderNodeVectorMath")
+    grown_position.operation = "ADD"
+    links.new(group_input.outputs["Origin"], grown_position.inputs[0])
+    links.new(scaled_offset.outputs["Vector"], grown_position.inputs[1])
+    set_position = nodes.new("GeometryNodeSetPosition")
+    links.new(group_input.outputs["Geometry"], set_position.inputs["Geometry"])
+    links.new(grown_position.outputs["Vector"], set_position.inputs["Position"])
+    links.new(set_position.outputs["Geometry"], instance_on_points.inputs["Points"])
+    # Scale instances up.
+    grown_scale = nodes.new("ShaderNodeVectorMath")
+    grown_scale.operation = "SCALE"
+    links.new(group_input.outputs["Scale"], grown_scale.inputs[0])
+    links.new(t.outputs[0], grown_scale.inputs["Scale"])
+    links.new(grown_scale.outputs["Vector"], instance_on_points.inputs["Scale"])
+    return node_group
+
+# Read geometry nodes modifier input from point attribute.
+def use_modifier_attribute(modifier, input_name, attribute_name):
+    identifier = modifier.node_group.inputs[input_name].identifier
+    modifier[identifier + "_use_attribute"] = True
+    modifier[identifier + "_attribute_name"] = attribute_name
+
+# Point mesh with one vertex per location. Point attributes are given as dict name -> (type, array).
+def create_point_mesh(name, locations, attributes={}):
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(locations))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(locations, dtype=np.float32).ravel())
+    for attribute_name, (attribute_type, values) in attributes.items():
+        attribute = mesh.attributes.new(attribute_name, attribute_type, "POINT")
+        if attribute_type == "INT":
+            attribute.data.foreach_set("value", np.ascontiguousarray(values, dtype=np.int32).ravel())
+        elif attribute_type == "FLOAT":
+            attribute.data.foreach_set("value", np.ascontiguousarray(values, dtype=np.float32).ravel())
+        else:
+            attribute.data.foreach_set("vector" if attribute_type == "FLOAT_VECTOR" else "color", np.ascontiguousarray(values, dtype=np.float32).ravel())
+    mesh.update()
+    return mesh
+
+# Point mesh of grown structure for the points instancer. Prototype indices follow order of base elements in
+# "Collection Info" node, which orders children by name.
+def create_instancer_point_mesh(structure, base_elements, name="growth"):
+    sorted_names = sorted(base_elem.name for base_elem in base_elements)
+    sorted_index = np.array([sorted_names.index(base_elem.name) for base_elem in base_elements])
+    locations, rotations, scales = growth.decompose(structure["matrices"])
+    attributes = {
+        "rotation": ("FLOAT_VECTOR", rotations),
+        "scale": ("FLOAT_VECTOR", scales),
+        "prototype_index": ("INT", sorted_index[structure["prototypes"]]),
+    }
+    # Point attributes are passed on to instances, where shader reads them, see `create_shader()`.
+    if "variation" in structure:
+        attributes["variation"] = ("FLOAT", structure["variation"])
+    if "birth_frames" in structure:
+        attributes["birth_frame"] = ("FLOAT", structure["birth_frames"])
+        attributes["grown_frame"] = ("FLOAT", structure["grown_frames"])
+        attributes["origin"] = ("FLOAT_VECTOR", structure["origins"])
+    return create_point_mesh(name + "_points", locations, attributes)
+
+# Instance all display elements of grown structure at once.
+# Single point cloud object stores location, rotation, scale and prototype index per element and geometry nodes instance
+# base elements on its points. Much cheaper than an object per element for scenes with tens of thousands of elements.
+def instance_points(structure, base_elements, name="growth"):
+    with profiling.phase("instance_points") as record:
+        record["elements"] = len(structure["matrices"])
+        # Collection with base elements for "Collection Info" node. Not linked to the scene.
+        prototype_collection = bpy.data.collections.new(name + "_prototypes")
+        for base_elem in base_elements:
+            prototype_collection.objects.link(base_elem)
+        mesh = create_instancer_point_mesh(structure, base_elements, name=name)
+        obj = bpy.data.objects.new(name + "_points_obj", mesh)
+        bpy.context.collection.objects.link(obj)
+        modifier = obj.modifiers.new(name + "_instancer", "NODES")
+        animated = "birth_frames" in structure
+        modifier.node_group = create_points_instancer_node_group(prototype_collection, name=name + "_instancer", animated=animated)
+        use_modifier_attribute(modifier, "Rotation", "rotation")
+        use_modifier_attribute(modifier, "Scale", "scale")
+        use_modifier_attribute(modifier, "Prototype", "prototype_index")
+        if animated:
+            use_modifier_attribute(modifier, "Birth Frame", "birth_frame")
+            use_modifier_attribute(modifier, "Grown Frame", "grown_frame")
+            use_modifier_attribute(modifier, "Origin", "origin")
+    return obj
+
+# Face table of the mesh as arrays: centers (n,3), normals (n,3), areas (n).
+def mesh_face_table(mesh):
+    n_polygons = len(mesh.polygons)
+    centers = np.empty(n_polygons * 3, dtype=np.float32)
+    normals = np.empty(n_polygons * 3, dtype=np.float32)
+    areas = np.empty(n_polygons, dtype=np.float32)
+    mesh.polygons.foreach_get("center", centers)
+    mesh.polygons.foreach_get("normal", normals)
+    mesh.polygons.foreach_get("area", areas)
+    return centers.reshape(-1, 3), normals.reshape(-1, 3), areas
+
+# Face table of computational pentasphere.
+def penta_sphere_face_table():
+    bm = create_penta_sphere_bmesh()
+    mesh = bpy.data.meshes.new("comp_penta_sphere_mesh")
+    bm.to_mesh(mesh)
+    bm.free()
+    face_table = mesh_face_table(mesh)
+    bpy.data.meshes.remove(mesh)
+    return face_table
+
+# Keyword arguments of `growth.grow_transforms()` for growth from starting_elem.
+def growth_job(starting_elem=None, n_iter=3, scale_range=(0.8, 1.0), base_elements=[], lights=[], face_grow_factor_per_iter=0.7, collision_tolerance=None, seed=None):
+    # NOTE: computational elements are simplest pentaspheres. Those elements are used for grow logic. Later they are replaced with more 
+    # interesting basic elements. Growth logic only needs their face table and transforms, see `growth.grow_transforms()`.
+    if starting_elem:
+        face_centers, face_normals, face_areas = mesh_face_table(starting_elem.data)
+        start_matrix = np.array(starting_elem.matrix_basis)
+    else:
+        face_centers, face_normals, face_areas = penta_sphere_face_table() # NOTE: if starting_elem is not given, then pentasphere in the center of world orign will be used.
+        start_matrix = np.identity(4)
+    light_prototypes = ["hollow" in base_elem.name for base_elem in base_elements] # add point lights in pentaspheres with holes
+    return {
+        "face_centers": face_centers, "face_normals": face_normals, "face_areas": face_areas,
+        "n_iter": n_iter, "scale_range": scale_range, "n_prototypes": len(base_elements),
+        "face_grow_factor_per_iter": face_grow_factor_per_iter, "start_matrix": start_matrix,
+        "light_prototypes": light_prototypes, "n_lights": len(lights),
+        "collision_tolerance": collision_tolerance, "seed": seed,
+    }
+
+# Drop hidden elements of structure before instancing, see `culling.py`. Structure itself is not changed.
+# visibility - dict: "occlusion" - cull elements covered by neighbours, "planes" - camera frustum planes or None
+# face_table - face centers, normals and areas of computational element the structure was grown with
+# Returns structure of visible elements and structure with lights of occluded elements removed.
+def cull_structure(structure, face_table, visibility=None, first_element=0):
+    if visibility is None:
+        return structure, structure
+    with profiling.phase("cull") as record:
+        culled, occluded, report = culling.cull(structure, *face_table, planes=visibility["planes"], occlusion=visibility["occlusion"])
+        record["elements"] = report["elements"]
+    print("Culling: {culled} of {elements} elements removed ({vanishing} vanishing, {occluded} occluded, {outside_frustum} outside frustum)".format(**report))
+    return culling.select_elements(structure, ~culled, first_element=first_element), culling.drop_lights(structure, occluded, first_element=first_element)
+
+# Frustum planes of camera object for `culling.frustum_planes()`.
+def camera_frustum_planes(camera):
+    render = bpy.context.scene.render
+    # NOTE: assumes horizontal sensor fit, shift is ignored.
+    tan_half_fov_x = camera.data.sensor_width / (2.0 * camera.data.lens)
+    tan_half_fov_y = tan_half_fov_x * (render.resolution_y * render.pixel_aspect_y) / (render.resolution_x * render.pixel_aspect_x)
+    return culling.frustum_planes(np.array(camera.matrix_world), tan_half_fov_x, tan_half_fov_y, near=camera.data.clip_start, far=camera.data.clip_end)
+
+# Per element value in [0,1] read by shared material, see `create_shader()`.
+# variation - dict: "mode" = {"random", "depth"}, "seed" and "max_generation"
+# "random" value of element depends only on seed and element index, so it is the same in every slice of exported structure.
+# "depth" is generation of element relative to max_generation, gradient from starting element to the tips.
+def element_variation(structure, variation, first_element=0):
+    n_elements = len(structure["matrices"])
+    if variation["mode"] == "depth":
+        return np.asarray(structure["generations"]) / max(variation["max_generation"], 1)
+    if variation["mode"] == "random":
+        element_keys = growth_tree.splitmix64(np.arange(first_element, first_element + n_elements, dtype=np.uint64))
+        return growth_tree.uniform(element_keys ^ growth_tree.root_key(variation["seed"] or 0), growth_tree.STREAM_VARIATION)
+    raise ValueError("Unknown variation mode: " + str(variation["mode"]))
 
+# Structure with growth animation frames and origin of each element, see `growth.growth_animation()`.
+# animation - dict: "frame_start", "frames_per_generation", "grow_frames"
+def animation_structure(structure, animation):
+    birth_frames, grown_frames, origins = growth.growth_animation(structure, **animation)
+    return dict(structure, birth_frames=birth_frames, grown_frames=grown_frames, origins=origins)
+
+# Instance visible display elements of grown structure.
+# variation - per element variation, see `element_variation()`
+# animation - growth animation, see `animation_structure()`
+# Returns structure whose lights should be placed, see `cull_structure()`.
+def instance_display(structure, base_elements=[], instancing="objects", name="growth", first_element=0, lods=None, visibility=None, face_table=None,
+                     variation=None, animation=None):
+    if variation is not None:
+        structure = dict(structure, variation=element_variation(structure, variation, first_element=first_element))
+    if animation is not None:
+        structure = animation_structure(structure, animation)
+    if visibility is not None and face_table is None:
+        face_table = penta_sphere_face_table()
+    display, light_structure = cull_structure(structure, face_table, visibility, first_element=first_element)
+    display, display_elements = lod_structure(display, base_elements, lods)
+    if instancing == "points":
+        instance_points(display, display_elements, name=name)
+    else:
+        instance_objects(display, display_elements, first_element=first_element)
+    return light_structure
+
+# Instance display elements and lights of grown structure.
+# first_element - element index of first element in structure, when only part of a structure is instanced
+# light_budget - if given, lights are merged into at most this many lights, see `instance_clustered_lights()`
+# lods - detail levels of base elements, see `lod_structure()`
+# visibility, face_table - culling of hidden elements, see `cull_structure()`, pentasphere face table is used if not given
+# variation - per element variation, see `element_variation()`
+# animation - growth animation, see `animation_structure()`
+# NOTE: lights are not animated.
+def instance_structure(structure, base_elements=[], lights=[], instancing="objects", name="growth", first_element=0, light_budget=None, lods=None,
+                       visibility=None, face_table=None, variation=None, animation=None):
+    light_structure = instance_display(structure, base_elements, instancing=instancing, name=name, first_element=first_element, lods=lods,
+                                       visibility=visibility, face_table=face_table, variation=variation, animation=animation)
+    if light_budget is None:
+        instance_lights(light_structure, base_elements, lights, first_element=first_element)
+    else:
+        instance_clustered_lights(light_structure, lights, light_budget, first_element=first_element, name=name + "_lights")
+
+# Instance elements [start, stop) of exported structure, growth is not replayed.
+# NOTE: culling assumes structure was grown from pentasphere and sees only neighbours inside [start, stop).
+def import_structure(path, base_elements=[], lights=[], instancing="points", start=0, stop=None, name="growth", light_budget=None, lods=None, visibility=None,
+                     variation=None, animation=None):
+    metadata, structure = structure_io.import_structure(path, start=start, stop=stop)
+    instance_structure(structure, base_elements, lights, instancing=instancing, name=name, first_element=start, light_budget=light_budget, lods=lods,
+                       visibility=visibility, variation=variation, animation=animation)
+    return structure
 
 # n_iter - scalar, int e.g. n=1
 # starting_elem - pentasphere from which growth starts.
 # scale_range - vector, float e.g. (min=0.1, max=0.8)
 # base_elements - list of objects representing base elements that will be instances
 # lights - list of lights that will be instances
-def grow(starting_elem=None, n_iter=3, scale_range=(0.8, 1.0), base_elements=[], lights=[], face_grow_factor_per_iter=0.7):
-    rng = default_rng()
-    # Create starting computation element.
-    # NOTE: computational elements are simplest pentaspheres. Those elements are used for grow logic. Later they are replaced with more 
-    # interesting basic elements.
-    comp_instancing_elem = None
-    if starting_elem:
-        comp_instancing_elem = starting_elem
+# collision_tolerance - if given, new elements overlapping existing ones more than this fraction of summed radii are rejected
+# instancing = {"objects", "points"} - one object per display element or single point cloud instancing base elements
+# seed - int, same seed gives same structure, random if None
+# max_elements, max_frontier, max_bytes, budget_mode, checkpoint_path, resume_from - see `growth.grow_generations()`
+# light_budget - if given, lights are placed after growth and merged into at most this many lights
+# lods - detail levels of base elements, see `lod_structure()`
+# visibility - culling of hidden elements, see `cull_structure()`
+# variation - per element variation, see `element_variation()`
+# animation - growth animation, see `animation_structure()`
+# Growth is streamed: with "objects" instancing each generation is instanced as soon as it is grown. Culling needs
+# all neighbours of an element, so with visibility given elements are instanced once growth is done.
+# Returns compact structure, see `growth.compact()`.
+def grow(starting_elem=None, n_iter=3, scale_range=(0.8, 1.0), base_elements=[], lights=[], face_grow_factor_per_iter=0.7, collision_tolerance=None, instancing="objects", seed=None,
+         max_elements=None, max_frontier=None, max_bytes=None, budget_mode="thin", checkpoint_path=None, resume_from=None, light_budget=None, lods=None, visibility=None, variation=None, animation=None):
+    job = growth_job(starting_elem=starting_elem, n_iter=n_iter, scale_range=scale_range, base_elements=base_elements, lights=lights,
+                     face_grow_factor_per_iter=face_grow_factor_per_iter, collision_tolerance=collision_tolerance, seed=seed)
+    stream_objects = instancing == "objects" and visibility is None
+    generations = []
+    for generation in growth.grow_generations(**job, max_elements=max_elements, max_frontier=max_frontier, max_bytes=max_bytes, budget_mode=budget_mode,
+                                              checkpoint_path=checkpoint_path, resume_from=resume_from):
+        generation = dict(growth.compact(generation), first_element=generation["first_element"])
+        if stream_objects:
+            display = generation
+            if variation is not None:
+                display = dict(display, variation=element_variation(display, variation, first_element=generation["first_element"]))
+            if animation is not None:
+                display = animation_structure(display, animation)
+            display, display_elements = lod_structure(display, base_elements, lods)
+            instance_objects(display, display_elements, first_element=generation["first_element"])
+            if light_budget is None:
+                # Lights are placed in collections of base elements, not of their detail levels, same as `instance_structure()`.
+                instance_lights(generation, base_elements, lights, first_element=generation["first_element"])
+        generations.append(generation)
+    structure = growth.compact(growth.concatenate_generations(generations))
+    # NOTE: resumed growth does not start with element 0.
+    first_element = generations[0]["first_element"] if generations else 0
+    if not stream_objects:
+        instance_structure(structure, base_elements, lights, instancing=instancing, first_element=first_element, light_budget=light_budget, lods=lods,
+                           visibility=visibility, face_table=(job["face_centers"], job["face_normals"], job["face_areas"]), variation=variation,
+                           animation=animation)
+    elif light_budget is not None:
+        # Light budget is global, so lights are placed only once whole structure is grown.
+        instance_clustered_lights(structure, lights, light_budget, first_element=first_element)
+    return structure
+
+# Instance nodes of growth tree, reusing instances of a previous call for nodes that did not change.
+# instances - dict returned by previous call, None for the first call
+# Returns dict of instances to pass to the next call.
+def instance_tree(tree, base_elements=[], lights=[], instancing="objects", name="growth", instances=None):
+    structure = growth_tree.tree_structure(tree)
+    if instances is None:
+        instances = {"objects": {}, "lights": {}, "points": None}
+    if instancing == "points":
+        # Point mesh is rebuilt in bulk, which is cheap, and swapped into the existing instancer.
+        if instances["points"] is None:
+            instances["points"] = instance_points(structure, base_elements, name=name)
+        else:
+            old_mesh = instances["points"].data
+            instances["points"].data = create_instancer_point_mesh(structure, base_elements, name=name)
+            bpy.data.meshes.remove(old_mesh)
+    else:
+        # Node is identified by its random stream key, base element (by name, so swapped base elements are re-instanced) and transform.
+        objects = {}
+        with profiling.phase("instance_objects") as record:
+            for elem_i, (key, prototype, matrix) in enumerate(zip(tree["keys"], tree["prototypes"], tree["matrices"])):
+                base_elem = base_elements[prototype]
+                signature = (int(key), base_elem.name, np.round(matrix, 6).tobytes())
+                if signature in instances["objects"]:
+                    objects[signature] = instances["objects"].pop(signature)
+                    continue
+                objects[signature] = create_instance(base_elem, basis=mathutils.Matrix(matrix.tolist()), collection_name=base_elem.name if elem_i > 0 else None)
+                record["elements"] += 1
+        remove_list(instances["objects"].values())
+        instances["objects"] = objects
+    light_objects = {}
+    for elem_i, light_i in zip(structure["light_elements"], structure["light_indices"]):
+        base_elem = base_elements[tree["prototypes"][elem_i]]
+        signature = (int(tree["keys"][elem_i]), lights[light_i].name, base_elem.name, np.round(tree["matrices"][elem_i][:3, 3], 6).tobytes())
+        if signature in instances["lights"]:
+            light_objects[signature] = instances["lights"].pop(signature)
+            continue
+        translate = mathutils.Vector(tree["matrices"][elem_i][:3, 3].tolist())
+        light_objects[signature] = create_instance(lights[light_i], translate=translate, scale=1, collection_name=base_elem.name)
+    remove_list(instances["lights"].values())
+    instances["lights"] = light_objects
+    return instances
+
+# Grow explicit growth tree which can be regrown incrementally with `regrow()`, see `growth_tree.py`.
+# Returns tree and its instances.
+def grow_tree(starting_elem=None, n_iter=3, scale_range=(0.8, 1.0), base_elements=[], lights=[], face_grow_factor_per_iter=0.7, instancing="objects", seed=0):
+    job = growth_job(starting_elem=starting_elem, n_iter=n_iter, scale_range=scale_range, base_elements=base_elements, lights=lights,
+                     face_grow_factor_per_iter=face_grow_factor_per_iter, seed=seed)
+    del job["collision_tolerance"]
+    tree = growth_tree.grow_tree(**job)
+    return tree, instance_tree(tree, base_elements, lights, instancing=instancing)
+
+# Regrow generations from_generation onwards with changed parameters (scale_range, face_grow_factor_per_iter, n_iter)
+# or changed base elements and re-instance only changed nodes.
+def regrow(tree, instances, from_generation=1, base_elements=[], lights=[], instancing="objects", **changed_params):
+    light_prototypes = ["hollow" in base_elem.name for base_elem in base_elements] # add point lights in pentaspheres with holes
+    tree = growth_tree.regrow(tree, from_generation=from_generation, n_prototypes=len(base_elements), light_prototypes=light_prototypes,
+                              n_lights=len(lights), **changed_params)
+    return tree, instance_tree(tree, base_elements, lights, instancing=instancing, instances=instances)
+
+# Grow from each of starting_elems in a process pool, element i uses seed + i.
+# Only transforms are computed in worker processes, instancing is done here once all of them are done.
+def grow_many(starting_elems, seed=0, max_workers=None, n_iter=3, scale_range=(0.8, 1.0), base_elements=[], lights=[], face_grow_factor_per_iter=0.7, collision_tolerance=None, instancing="objects",
+              max_elements=None, max_frontier=None, max_bytes=None, budget_mode="thin", light_budget=None, lods=None, visibility=None, variation=None, animation=None):
+    budgets = {"max_elements": max_elements, "max_frontier": max_frontier, "max_bytes": max_bytes, "budget_mode": budget_mode}
+    jobs = [dict(growth_job(starting_elem=starting_elem, n_iter=n_iter, scale_range=scale_range, base_elements=base_elements, lights=lights,
+                            face_grow_factor_per_iter=face_grow_factor_per_iter, collision_tolerance=collision_tolerance, seed=seed + elem_i), **budgets)
+            for elem_i, starting_elem in enumerate(starting_elems)]
+    # Spawned workers would import this script and bpy with it, so fork where possible.
+    mp_context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    structures = growth.grow_batch(jobs, max_workers=max_workers, mp_context=mp_context)
+    light_structures = []
+    for elem_i, (job, structure) in enumerate(zip(jobs, structures)):
+        face_table = (job["face_centers"], job["face_normals"], job["face_areas"])
+        structure_variation = None if variation is None else dict(variation, seed=job["seed"])
+        if light_budget is None:
+            instance_structure(structure, base_elements, lights, instancing=instancing, name="growth_" + str(elem_i), lods=lods, visibility=visibility,
+                               face_table=face_table, variation=structure_variation, animation=animation)
+        else:
+            light_structures.append(instance_display(structure, base_elements, instancing=instancing, name="growth_" + str(elem_i), lods=lods,
+                                                     visibility=visibility, face_table=face_table, variation=structure_variation, animation=animation))
+    if light_budget is not None:
+        # Light budget is shared by all structures.
+        instance_clustered_lights(growth.merge_structures(light_structures), lights, light_budget)
+    return structures
+
+# Default parameters of a generation job. Job files and command line arguments override them.
+DEFAULT_JOB = {
+    # Growth.
+    "n_iter": 15,
+    "scale_range": [0.9, 1.0],
+    "face_grow_factor_per_iter": 0.45,
+    "seed": 0,
+    "collision_tolerance": None,
+    "instancing": "points",
+    "max_elements": None,
+    "max_frontier": None,
+    "max_bytes": None,
+    "budget_mode": "thin",
+    # Names of objects to grow from, pentasphere in the world origin if empty.
+    "start_objects": [],
+    # Material parameters.
+    "shader_type": "diffuse",
+    "color": [1, 1, 1, 1],
+    "roughness": 0.3,
+    "ior": 1.45,
+    # Base elements: extruded pentasphere and hollow pentaspheres with given hole sizes.
+    "extruded": True,
+    "hole_sizes": [0.1, 0.2, 0.3, 0.4],
+    # Lights.
+    "light_color": [0.823102, 0.285278, 0.118767],
+    "light_intensities": [20.0, 10.0, 5.0],
+    # Maximum number of lights, nearby lights are merged after growth. None places every light.
+    "light_budget": None,
+    # Detail levels of base elements: None, "scale", "depth" or "screen" and thresholds, see `growth.select_lods()`.
+    # Thresholds are in units of the mode (scale, generation, pixels), None uses `growth.LOD_THRESHOLDS` of the mode.
+    "lod_mode": None,
+    "lod_thresholds": None,
+    # Camera for "screen" LOD mode, scene camera if None.
+    "lod_camera": None,
+    # Per element color variation: None, "random" or "depth" (generation gradient), color is mixed towards variation_color.
+    "variation": None,
+    "variation_color": [0.1, 0.3, 0.8, 1],
+    # Growth animation: generation i is born at frame_start + i * frames_per_generation and grows from the face of its parent
+    # in grow_frames (frames_per_generation if None).
+    "animate": False,
+    "frame_start": 1,
+    "frames_per_generation": 10,
+    "grow_frames": None,
+    # Culling before instancing: elements covered by neighbours and elements outside camera frustum, see `culling.py`.
+    "cull_occluded": False,
+    "cull_frustum": False,
+    # Camera for frustum culling, scene camera if None.
+    "cull_camera": None,
+    # Prototypes are cached next to this script, later runs skip modelling. None disables cache.
+    "cache_dir": os.path.join(os.path.dirname(os.path.abspath(__file__)), "prototype_cache"),
+    # Outputs.
+    "output_blend": None,
+    # Exported structure, see `structure_io.py`.
+    "export": None,
+    # Instance elements [import_start, import_stop) of exported structure instead of growing.
+    "import": None,
+    "import_start": 0,
+    "import_stop": None,
+    # JSON report of time, calls and elements per phase and growth iteration, see `profiling.py`.
+    "profile": None,
+}
+
+# Generator, geometry parameters, location and name of each base element of job.
+def base_element_specs(job):
+    specs = []
+    if job["extruded"]:
+        specs.append((create_penta_sphere_extruded, {}, mathutils.Vector((50,20,0)), "penta_sphere_extruded"))
+    for hole_i, hole_size in enumerate(job["hole_sizes"]):
+        specs.append((create_penta_sphere_hollow2, {"hole_size": hole_size}, mathutils.Vector((50,40+10*hole_i,0)), "penta_sphere_hollow2"))
+    return specs
+
+def job_material(job):
+    return {"shader_type": job["shader_type"], "color": tuple(job["color"]), "roughness": job["roughness"], "ior": job["ior"]}
+
+# Create base elems that will be instanced.
+def create_base_elements(job):
+    return [create_prototype(generator, geometry_params, location=location, name=name, cache_dir=job["cache_dir"], **job_material(job))
+            for generator, geometry_params, location, name in base_element_specs(job)]
+
+# Create detail levels of base elements, see `lod_structure()`. None if job does not use LODs.
+# Level 0 is the base element itself, coarser levels are placed above it. Levels with the same generator and parameters
+# (e.g. plain pentasphere proxy) are created once and shared by all base elements.
+def create_lods(job, base_elements):
+    if job["lod_mode"] is None:
+        return None
+    elements = []
+    rows = []
+    shared = {}
+    for base_elem, (generator, geometry_params, location, name) in zip(base_elements, base_element_specs(job)):
+        row = [len(elements)]
+        elements.append(base_elem)
+        for level, (lod_generator, lod_params) in enumerate(prototype_lods(generator, geometry_params)[1:], start=1):
+            key = (lod_generator.__name__, json.dumps(lod_params, sort_keys=True))
+            if key not in shared:
+                shared[key] = len(elements)
+                elements.append(create_prototype(lod_generator, lod_params, location=location + mathutils.Vector((0,0,5*level)),
+                                                 name=lod_generator.__name__[len("create_"):] + "_lod", cache_dir=job["cache_dir"], **job_material(job)))
+            row.append(shared[key])
+        rows.append(row)
+    n_levels = max(len(row) for row in rows)
+    table = np.array([row + row[-1:] * (n_levels - len(row)) for row in rows])
+    lods = {"elements": elements, "table": table, "mode": job["lod_mode"], "thresholds": job["lod_thresholds"], "camera_matrix": None, "focal_length": None}
+    if job["lod_mode"] == "screen":
+        camera = bpy.data.objects[job["lod_camera"]] if job["lod_camera"] else bpy.context.scene.camera
+        render = bpy.context.scene.render
+        # NOTE: assumes horizontal sensor fit.
+        lods["camera_matrix"] = np.array(camera.matrix_world)
+        lods["focal_length"] = camera.data.lens / camera.data.sensor_width * render.resolution_x * render.resolution_percentage / 100.0
+    return lods
+
+# Create light points that will be instanced.
+def create_lights(job):
+    return [create_point_light(location=mathutils.Vector((0,0,0)), color=mathutils.Vector(job["light_color"]), intensity=intensity) for intensity in job["light_intensities"]]
+
+# Variation settings of job, see `element_variation()`. None if job does not vary color.
+# All display elements get one shared material which reads the variation.
+def create_variation(job, display_elements):
+    if job["variation"] is None:
+        return None
+    material = job_material(job)
+    replace_material(display_elements, get_material(material["shader_type"], material["color"], material["roughness"], material["ior"],
+                                                     "variation_material", variation_color=tuple(job["variation_color"])))
+    return {"mode": job["variation"], "seed": job["seed"], "max_generation": job["n_iter"]}
+
+# Animation settings of job, see `animation_structure()`. None if job is not animated.
+# Scene frame range is set to cover the whole growth.
+def create_animation(job):
+    if not job["animate"]:
+        return None
+    scene = bpy.context.scene
+    scene.frame_start = job["frame_start"]
+    grow_frames = job["frames_per_generation"] if job["grow_frames"] is None else job["grow_frames"]
+    scene.frame_end = int(np.ceil(job["frame_start"] + job["n_iter"] * job["frames_per_generation"] + grow_frames))
+    return {"frame_start": job["frame_start"], "frames_per_generation": job["frames_per_generation"], "grow_frames": job["grow_frames"]}
+
+# Culling settings of job, see `cull_structure()`. None if job does not cull.
+def create_visibility(job):
+    if not (job["cull_occluded"] or job["cull_frustum"]):
+        return None
+    planes = None
+    if job["cull_frustum"]:
+        camera = bpy.data.objects[job["cull_camera"]] if job["cull_camera"] else bpy.context.scene.camera
+        planes = camera_frustum_planes(camera)
+    return {"occlusion": job["cull_occluded"], "planes": planes}
+
+# Run generation job: create base elements and lights, grow from starting elems and write outputs.
+# Returns list of compact grown structures.
+def run_job(job, starting_elems=[]):
+    job = dict(DEFAULT_JOB, **job)
+    if job["profile"]:
+        profiling.enable()
+    with profiling.phase("base_elements"):
+        base_elements = create_base_elements(job)
+    with profiling.phase("lights"):
+        lights = create_lights(job)
+    with profiling.phase("lods"):
+        lods = create_lods(job, base_elements)
+    with profiling.phase("materials"):
+        variation = create_variation(job, lods["elements"] if lods else base_elements)
+    growth_kwargs = {"n_iter": job["n_iter"], "scale_range": tuple(job["scale_range"]), "base_elements": base_elements, "lights": lights,
+                     "face_grow_factor_per_iter": job["face_grow_factor_per_iter"], "collision_tolerance": job["collision_tolerance"],
+                     "instancing": job["instancing"], "max_elements": job["max_elements"], "max_frontier": job["max_frontier"],
+                     "max_bytes": job["max_bytes"], "budget_mode": job["budget_mode"], "light_budget": job["light_budget"], "lods": lods,
+                     "visibility": create_visibility(job), "variation": variation,
+                     "animation": create_animation(job)}
+    starting_elems = list(starting_elems) + [bpy.data.objects[name] for name in job["start_objects"]]
+    if job["import"]:
+        # Instance exported structure instead of growing.
+        with profiling.phase("import") as record:
+            structures = [import_structure(job["import"], base_elements, lights, instancing=job["instancing"], start=job["import_start"], stop=job["import_stop"],
+                                            light_budget=job["light_budget"], lods=lods, visibility=growth_kwargs["visibility"],
+                                            variation=variation, animation=growth_kwargs["animation"])]
+            record["elements"] = len(structures[0]["matrices"])
     else:
-        comp_instancing_elem = create_penta_sphere() # NOTE: if starting_elem is not given, then pentasphere in the center of world orign will be used.
-    # TODO: Also create display element at that position.
-    rand_elem_idx = rng.integers(len(base_elements), size=1)[0]
-    base_elem = base_elements[rand_elem_idx]
-    display_elem = create_instance(base_elem, translate=mathutils.Vector((0,0,0)), scale=1.0, rotate=("Z", 0.0), basis=comp_instancing_elem.matrix_basis, tbn=mathutils.Matrix.Identity(4))
-    list_of_all_comp_objects = []
-    curr_comp_list = []
-    curr_comp_list.append(comp_instancing_elem)
-    list_of_all_comp_objects.append(comp_instancing_elem)
-    face_grow_factor = 1.0 # First iteration starts with the default value. Each next can have smaller or larger factor
-    for iter_i in range(n_iter):
-        new_comp_list = []
-        for curr_comp_elem in curr_comp_list:
-            #done_for_curr_comp_elem = False
-            for polygon in curr_comp_elem.data.polygons:
-                if mathutils.noise.random() < face_grow_factor and polygon.area > 0.1: # NOTE: now computational/logical pentaspheres have merges vertices, so only large faces exist!
-                    # Calculate tranformation for base element for the current face.
-                    p = polygon.center
-                    n = polygon.normal
-                    if n[2] < 0.1: # NOTE: normal is local and it is not always pointing in world +z!
-                        continue
-                    t, b = pixar_onb(n)
-                    tbn = mathutils.Matrix((t, b, n)) # NOTE: using pixar_onb()?
-                    tbn = tbn.transposed() # TODO: why transposing?
-                    tbn.resize_4x4()
-                    scale = max(curr_comp_elem.scale) * ((scale_range[1] - scale_range[0]) * mathutils.noise.random() + scale_range[0]) # NOTE: max(curr_comp_elem.dimensions) vs max(curr_comp_elem.scale)
-                    translate = p + n * scale / 1.5 # touch with faces! 
-                    # Create display elem in according collection for face.
-                    # Choose random base element.
-                    rand_elem_idx = rng.integers(len(base_elements), size=1)[0]
-                    base_elem = base_elements[rand_elem_idx]
-                    display_elem = create_instance(base_elem, translate=translate, scale=scale, rotate=(n, 0.0), basis=curr_comp_elem.matrix_basis, tbn=tbn, collection_name=base_elem.name)
-                    if len(lights) > 0 and "hollow" in display_elem.name: # add point lights in pentaspheres with holes
-                        if mathutils.noise.random() < 0.1: # randomly choose if light will be added or not.
-                            rand_light_idx = rng.integers(len(lights), size=1)[0]
-                            light = lights[rand_light_idx]
-                            create_instance(light, translate=display_elem.location, scale=1, rotate=(n, 0.0), basis=mathutils.Matrix.Identity(4), tbn=mathutils.Matrix.Identity(4), collection_name=base_elem.name)
-                    # Create computational elem per face.
-                    new_comp_elem = create_instance(comp_instancing_elem, translate=translate, scale=scale, rotate=(n, 0.0), basis=curr_comp_elem.matrix_basis, tbn=tbn)
-                    new_comp_list.append(new_comp_elem)
-                    list_of_all_comp_objects.append(new_comp_elem)
-                    #if iter_i % 2 == 0:
-                    #    done_for_curr_comp_elem = True
-                    #    break
-            #if iter_i % 2 == 0 and done_for_curr_comp_elem:
-            #    break
-        curr_comp_list = new_comp_list
-        face_grow_factor = face_grow_factor * face_grow_factor_per_iter
-        if face_grow_factor < 0.2:
-            face_grow_factor = 0.2
-    remove_list(list_of_all_comp_objects)
-
-def main():
-    starting_elems = bpy.context.selected_objects
+        # Perfom growth.
+        with profiling.phase("grow") as record:
+            if len(starting_elems) > 0:
+                structures = grow_many(starting_elems, seed=job["seed"], **growth_kwargs)
+            else:
+                structures = [grow(starting_elem=None, seed=job["seed"], **growth_kwargs)]
+            record["elements"] = sum(len(structure["matrices"]) for structure in structures)
+    if job["export"]:
+        with profiling.phase("export"):
+            seeds = [job["seed"] + structure_i for structure_i in range(len(structures))]
+            structure_io.export_structure(job["export"], growth.merge_structures(structures),
+                                          {"seeds": seeds, "params": job, "prototype_names": [base_elem.name for base_elem in base_elements]})
+    if job["output_blend"]:
+        with profiling.phase("save_blend"):
+            bpy.ops.wm.save_as_mainfile(filepath=os.path.abspath(job["output_blend"]))
+    if job["profile"]:
+        profiling.write_report(job["profile"])
+        profiling.disable()
+    return structures
+
+# Read job parameters from JSON or TOML file.
+def load_job_file(path):
+    if path.endswith(".toml"):
+        # NOTE: tomllib is in standard library from Python 3.11, Blender 3.0/3.1 ship older Python which needs tomli.
+        try:
+            import tomllib
+        except ModuleNotFoundError:
+            try:
+                import tomli as tomllib
+            except ModuleNotFoundError:
+                raise ModuleNotFoundError("TOML job files need Python 3.11+ or the tomli package, use a JSON job file instead") from None
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return json.load(f)
+
+# Command line arguments are given after "--": blender -b -P generative.py -- --job job.json --seed 3
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="blender -b -P generative.py --", description="Dodecahedron growth.")
+    parser.add_argument("--job", help="JSON or TOML job file, see DEFAULT_JOB for parameters")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--n-iter", type=int)
+    parser.add_argument("--scale-range", type=float, nargs=2)
+    parser.add_argument("--face-grow-factor-per-iter", type=float)
+    parser.add_argument("--collision-tolerance", type=float)
+    parser.add_argument("--instancing", choices=["objects", "points"])
+    parser.add_argument("--max-elements", type=int)
+    parser.add_argument("--max-frontier", type=int)
+    parser.add_argument("--max-bytes", type=int)
+    parser.add_argument("--budget-mode", choices=["thin", "stop"])
+    parser.add_argument("--light-budget", type=int, help="maximum number of lights, nearby lights are merged")
+    parser.add_argument("--lod-mode", choices=["scale", "depth", "screen"])
+    parser.add_argument("--lod-thresholds", type=float, nargs="+")
+    parser.add_argument("--lod-camera", help="camera object for screen size LOD, scene camera by default")
+    parser.add_argument("--variation", choices=["random", "depth"], help="per element color variation")
+    parser.add_argument("--variation-color", type=float, nargs=4)
+    parser.add_argument("--animate", action="store_true", default=None, help="animate growth generation by generation")
+    parser.add_argument("--frames-per-generation", type=float)
+    parser.add_argument("--grow-frames", type=float)
+    parser.add_argument("--cull-occluded", action="store_true", default=None, help="do not instance elements covered by neighbours")
+    parser.add_argument("--cull-frustum", action="store_true", default=None, help="do not instance elements outside camera frustum")
+    parser.add_argument("--cull-camera", help="camera object for frustum culling, scene camera by default")
+    parser.add_argument("--start-object", dest="start_objects", action="append", help="name of object to grow from, can be repeated")
+    parser.add_argument("--cache-dir")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output-blend", help="save resulting .blend file")
+    parser.add_argument("--export", help="export grown structure")
+    parser.add_argument("--import", dest="import", help="instance exported structure instead of growing")
+    parser.add_argument("--import-start", type=int)
+    parser.add_argument("--import-stop", type=int)
+    parser.add_argument("--profile", help="write JSON profiling report")
+    args = parser.parse_args(argv)
+    job = load_job_file(args.job) if args.job else {}
+    for key, value in vars(args).items():
+        if key not in ("job", "no_cache") and value is not None:
+            job[key] = value
+    if args.no_cache:
+        job["cache_dir"] = None
+    return job
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    job = parse_args(argv)
+    # Interactive session grows from selected objects, background runs depend only on the job.
+    starting_elems = [] if bpy.app.background else bpy.context.selected_objects
     """
     base_obj = None
     base_obj = bpy.context.selected_objects[0]
     # Get starting elem.
-    triangulate(base_obj)
-    samples = vertex_weighted_barycentric_sampling(base_obj=base_obj, n_samples=1)
+    positions, normals, weights, tbns = vertex_weighted_barycentric_sampling(base_obj=base_obj, n_samples=1)
     ps = create_penta_sphere() # TODO: remove once it is not needed!
     starting_elems = []
-    for sample in samples:
+    for p, tbn in zip(positions, tbns):
         starting_elem = create_instance(ps,
-                        translate=sample[0], # p
+                        translate=mathutils.Vector(p.tolist()),
                         scale=1.0,
                         rotate=("Z", 0.0),
                         basis=base_obj.matrix_basis,
-                        tbn=sample[3], # tbn
+                        tbn=mathutils.Matrix(tbn.tolist()),
                         collection_name=None)
         starting_elems.append(starting_elem)
     """
-    # Create base elems that will be instanced.
-    # Material parameters.
-    roughness = 0.3
-    color = (1,1,1, 1)
-    shader_type = "diffuse"
-    # Create base geometry.
-    base_elements = []
-    ps = create_penta_sphere(radius=1.0, location=mathutils.Vector((50,10,0)), name="penta_sphere", shader_type=shader_type, color=color, roughness=roughness, ior=1.45)
-    #base_elements.append(ps)
-    pse = create_penta_sphere_extruded(location=mathutils.Vector((50,20,0)), name="penta_sphere_extruded", shader_type=shader_type, color=color, roughness=roughness, ior=1.45)
-    base_elements.append(pse)
-    psh = create_penta_sphere_hollow(location=mathutils.Vector((50,30,0)), name="penta_sphere_hollow", shader_type=shader_type, color=color, roughness=roughness, ior=1.45)
-    #base_elements.append(psh)
-    hs21 = create_penta_sphere_hollow2(location=mathutils.Vector((50,40,0)), name="penta_sphere_hollow2", hole_size=0.1, hole_scale=0.1, shader_type=shader_type, color=color, roughness=roughness, ior=1.45)
-    hs22 = create_penta_sphere_hollow2(location=mathutils.Vector((50,50,0)), name="penta_sphere_hollow2", hole_size=0.2, hole_scale=0.1, shader_type=shader_type, color=color, roughness=roughness, ior=1.45)
-    hs23 = create_penta_sphere_hollow2(location=mathutils.Vector((50,60,0)), name="penta_sphere_hollow2", hole_size=0.3, hole_scale=0.1, shader_type=shader_type, color=color, roughness=roughness, ior=1.45)
-    hs24 = create_penta_sphere_hollow2(location=mathutils.Vector((50,70,0)), name="penta_sphere_hollow2", hole_size=0.4, hole_scale=0.1, shader_type=shader_type, color=color, roughness=roughness, ior=1.45)
-    base_elements.extend([hs21, hs22, hs23, hs24])
-    # Create light point that will be instanced.
-    lights = []
-    light1 = create_point_light(location=mathutils.Vector((0,0,0)), color=mathutils.Vector((0.823102, 0.285278, 0.118767)), intensity=20.0)
-    light2 = create_point_light(location=mathutils.Vector((0,0,0)), color=mathutils.Vector((0.823102, 0.285278, 0.118767)), intensity=10.0)
-    light3 = create_point_light(location=mathutils.Vector((0,0,0)), color=mathutils.Vector((0.823102, 0.285278, 0.118767)), intensity=5.0)
-    lights.append(light1)
-    lights.append(light2)
-    lights.append(light3)
-    # Perfom growth.
-    #for starting_elem in starting_elems:
-    grow(starting_elem=None, n_iter=15, scale_range=(0.9, 1.0), base_elements=base_elements, lights=lights, face_grow_factor_per_iter=0.45)
+    run_job(job, starting_elems)
     
 if __name__ == "__main__":
     main()
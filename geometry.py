@@ -0,0 +1,151 @@
+#
+# Procedural geometry of base elements: pure NumPy, no bpy/mathutils.
+# Author: Lovro Bosnar
+#
+# Meshes are described with the same arrays as Blender mesh data:
+# vertices (V,3), loop_vertices (L,), loop_starts (F,), loop_totals (F,)
+#
+
+import numpy as np
+
+# Mesh arrays of polygons given as (F,k) array of vertex indices, all polygons having k vertices.
+def polygon_mesh_arrays(vertices, polygons):
+    polygons = np.asarray(polygons)
+    n_polygons, k = polygons.shape
+    return {
+        "vertices": np.asarray(vertices, dtype=np.float32),
+        "loop_vertices": polygons.ravel().astype(np.int32),
+        "loop_starts": (np.arange(n_polygons) * k).astype(np.int32),
+        "loop_totals": np.full(n_polygons, k, dtype=np.int32),
+    }
+
+# Pentasphere with pentagonal hole through each face and hollow interior, built without boolean solver.
+# Same result as boolean difference of pentasphere with a pentasphere scaled by hole_size whose faces are
+# extruded outwards (see `generative.create_penta_sphere_hollow2()`):
+# - every face keeps a ring of quads between its outline and the hole, hole is the face scaled by hole_size around its center,
+# - every hole continues as a straight pentagonal tunnel to the face of the inner pentasphere scaled by hole_size,
+# - tunnels of neighbouring faces meet at the edges of the inner pentasphere, so the inner pentasphere is fully open.
+# vertices - (V,3) vertices of pentasphere
+# pentagons - (12,5) vertex indices of pentagonal faces with outward winding
+# hole_size - (0,1) scale of the hole relative to the face
+# tunnels - if False only the rings are built, lighter shell for distant elements where tunnels are not visible
+def hollow_penta_sphere(vertices, pentagons, hole_size=0.5, tunnels=True):
+    hole_size = float(np.clip(hole_size, 1e-3, 1.0 - 1e-3))
+    vertices = np.asarray(vertices, dtype=np.float64)
+    pentagons = np.asarray(pentagons)
+    n_vertices = len(vertices)
+    n_faces, k = pentagons.shape
+    centers = vertices[pentagons].mean(axis=1)
+    # Vertex layout: outer vertices | inner vertices | hole vertices (k per face).
+    inner = vertices * hole_size
+    hole = vertices[pentagons] * hole_size + centers[:, None, :] * (1.0 - hole_size)
+    all_vertices = np.concatenate((vertices, inner, hole.reshape(-1, 3)))
+    outer_idx = pentagons
+    inner_idx = pentagons + n_vertices
+    hole_idx = 2 * n_vertices + np.arange(n_faces * k).reshape(n_faces, k)
+    next_i = np.roll(np.arange(k), -1)
+    # Ring around the hole keeps face winding, tunnel walls use shared hole edge in opposite direction.
+    ring = np.stack((outer_idx, outer_idx[:, next_i], hole_idx[:, next_i], hole_idx), axis=2)
+    tunnel = np.stack((hole_idx, hole_idx[:, next_i], inner_idx[:, next_i], inner_idx), axis=2)
+    quads = np.concatenate((ring.reshape(-1, 4), tunnel.reshape(-1, 4))) if tunnels else ring.reshape(-1, 4)
+    # Drop vertices which are not used by any face.
+    used, quads = np.unique(quads, return_inverse=True)
+    return polygon_mesh_arrays(all_vertices[used], quads.reshape(-1, 4))
+
+# Sample points on triangles with density proportional to triangle area times its vertex weight.
+# Samples are uniform inside each triangle (square-root barycentric method).
+# vertices - (V,3), triangles - (T,3) vertex indices, triangle_normals - (T,3), vertex_weights - (V,)
+# n_samples - total number of samples
+# Returns positions (n,3), normals (n,3), interpolated weights (n,) and TBN matrices (n,4,4) with columns (t, b, n).
+def sample_triangles(vertices, triangles, triangle_normals, vertex_weights, n_samples, rng=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    vertices = np.asarray(vertices, dtype=np.float64)
+    triangles = np.asarray(triangles)
+    vertex_weights = np.asarray(vertex_weights, dtype=np.float64)
+    a, b, c = (vertices[triangles[:, i]] for i in range(3))
+    areas = 0.5 * np.linalg.norm(np.cross(b - a, c - a), axis=1)
+    density = areas * vertex_weights[triangles].mean(axis=1)
+    if n_samples <= 0 or density.sum() <= 0.0:
+        return np.zeros((0, 3)), np.zeros((0, 3)), np.zeros(0), np.zeros((0, 4, 4))
+    # Allocate samples to triangles.
+    tri_idx = rng.choice(len(triangles), size=n_samples, p=density / density.sum())
+    # https://www.cs.princeton.edu/~funk/tog02.pdf, section 4.2
+    r1 = np.sqrt(rng.random(n_samples))
+    r2 = rng.random(n_samples)
+    bary = np.stack((1.0 - r1, r1 * (1.0 - r2), r1 * r2), axis=1)
+    positions = np.einsum("ij,ijk->ik", bary, vertices[triangles[tri_idx]])
+    weights = np.einsum("ij,ij->i", bary, vertex_weights[triangles[tri_idx]])
+    normals = np.asarray(triangle_normals, dtype=np.float64)[tri_idx]
+    # Tangent along the first triangle edge, bitangent completes right-handed frame.
+    t = b[tri_idx] - a[tri_idx]
+    t /= np.linalg.norm(t, axis=1)[:, None]
+    bt = np.cross(normals, t)
+    tbn = np.zeros((n_samples, 4, 4))
+    tbn[:, :3, 0] = t
+    tbn[:, :3, 1] = bt
+    tbn[:, :3, 2] = normals
+    tbn[:, 3, 3] = 1.0
+    return positions, normals, weights, tbn
+
+# Cube projection UVs: each face is projected along the axis closest to its normal.
+# loop_coords - (L,3) vertex position of each loop, loop_normals - (L,3) normal of the face of each loop
+# cube_size - size of the cube which maps to the [0,1] UV square
+def cube_project_uvs(loop_coords, loop_normals, cube_size=2.0):
+    axis = np.abs(loop_normals).argmax(axis=1)
+    # Drop the projection axis, keep the other two in order.
+    keep = np.array([[1, 2], [0, 2], [0, 1]])[axis]
+    uvs = np.take_along_axis(loop_coords, keep, axis=1)
+    return uvs / cube_size + 0.5
+
+# Sphere projection UVs: longitude and latitude of each loop vertex around the origin.
+def sphere_project_uvs(loop_coords):
+    radius = np.maximum(np.linalg.norm(loop_coords, axis=1), 1e-12)
+    u = np.arctan2(loop_coords[:, 1], loop_coords[:, 0]) / (2.0 * np.pi) + 0.5
+    v = np.arcsin(np.clip(loop_coords[:, 2] / radius, -1.0, 1.0)) / np.pi + 0.5
+    return np.stack((u, v), axis=1)
+
+# Per face planar UVs packed into atlas, every face gets its own cell of a square grid.
+# Each face is projected on its plane with tangent along its first edge, all faces share the same scale
+# so texel density is uniform over the mesh.
+# arrays - mesh arrays, see `polygon_mesh_arrays()`
+# margin - free space around each face as fraction of the cell
+# Returns (L,2) UV of each loop.
+def planar_atlas_uvs(arrays, margin=0.05):
+    vertices = np.asarray(arrays["vertices"], dtype=np.float64)
+    loop_starts = np.asarray(arrays["loop_starts"])
+    loop_totals = np.asarray(arrays["loop_totals"])
+    n_faces = len(loop_starts)
+    if n_faces == 0:
+        return np.zeros((0, 2), dtype=np.float32)
+    loop_faces = np.repeat(np.arange(n_faces), loop_totals)
+    loop_coords = vertices[np.asarray(arrays["loop_vertices"])]
+    # Next loop of the same face.
+    loop_idx = np.arange(len(loop_faces))
+    next_loop = np.where(loop_idx - loop_starts[loop_faces] == loop_totals[loop_faces] - 1, loop_starts[loop_faces], loop_idx + 1)
+    # Newell normal, robust for non planar polygons.
+    normals = np.zeros((n_faces, 3))
+    np.add.at(normals, loop_faces, np.cross(loop_coords, loop_coords[next_loop]))
+    normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+    tangents = loop_coords[next_loop[loop_starts]] - loop_coords[loop_starts]
+    tangents -= normals * np.einsum("ij,ij->i", tangents, normals)[:, None]
+    tangents /= np.maximum(np.linalg.norm(tangents, axis=1), 1e-12)[:, None]
+    bitangents = np.cross(normals, tangents)
+    centers = np.zeros((n_faces, 3))
+    np.add.at(centers, loop_faces, loop_coords)
+    centers /= loop_totals[:, None]
+    offsets = loop_coords - centers[loop_faces]
+    uvs = np.stack((np.einsum("ij,ij->i", offsets, tangents[loop_faces]), np.einsum("ij,ij->i", offsets, bitangents[loop_faces])), axis=1)
+    # Center each face in its cell.
+    face_min = np.full((n_faces, 2), np.inf)
+    face_max = np.full((n_faces, 2), -np.inf)
+    np.minimum.at(face_min, loop_faces, uvs)
+    np.maximum.at(face_max, loop_faces, uvs)
+    uvs -= ((face_min + face_max) / 2.0)[loop_faces]
+    n_cols = int(np.ceil(np.sqrt(n_faces)))
+    cell_size = 1.0 / n_cols
+    extent = max((face_max - face_min).max(), 1e-12)
+    uvs *= cell_size * (1.0 - 2.0 * margin) / extent
+    cells = np.stack((np.arange(n_faces) % n_cols, np.arange(n_faces) // n_cols), axis=1)
+    uvs += ((cells + 0.5) * cell_size)[loop_faces]
+    return uvs.astype(np.float32)
@@ -0,0 +1,505 @@
+#
+# Growth core: pure NumPy, no bpy/mathutils.
+# Author: Lovro Bosnar
+#
+# Growth logic of `generative.grow()` working on arrays of 4x4 matrices instead of Blender objects.
+# Computational elements are never created: unit pentasphere is described once by its face table
+# (centers, normals, areas) and whole frontier is transformed at once. Blender layer only reads
+# resulting transforms at the end.
+#
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import binary_io
+import profiling
+
+# Faces of computational pentasphere that are used for growth.
+MIN_FACE_AREA = 0.1 # NOTE: computational pentaspheres have merged vertices, so only large faces exist!
+MIN_FACE_NORMAL_Z = 0.1 # NOTE: normal is local and it is not always pointing in world +z!
+# Face grow factor never falls below this value.
+MIN_FACE_GROW_FACTOR = 0.2
+# Probability that element with light prototype gets a point light.
+LIGHT_PROBABILITY = 0.1
+
+# Icosahedron vertices as created by `bmesh.ops.create_icosphere(subdivisions=1)`.
+ICOSPHERE_VERTICES = np.array([
+    (0.0, 0.0, -200.0),
+    (144.72, -105.144, -89.443),
+    (-55.277, -170.128, -89.443),
+    (-178.885, 0.0, -89.443),
+    (-55.277, 170.128, -89.443),
+    (144.72, 105.144, -89.443),
+    (55.277, -170.128, 89.443),
+    (-144.72, -105.144, 89.443),
+    (-144.72, 105.144, 89.443),
+    (55.277, 170.128, 89.443),
+    (178.885, 0.0, 89.443),
+    (0.0, 0.0, 200.0)]) / 200.0
+
+# Face table (centers, normals, areas) of pentasphere created from icosphere of given radius.
+# Pentasphere is dual of icosahedron: every icosahedron vertex becomes a pentagon face pointing in vertex direction.
+# Used when growth runs outside Blender. Inside Blender face table is read from the mesh itself.
+def unit_penta_sphere_faces(radius=1.0):
+    normals = ICOSPHERE_VERTICES / np.linalg.norm(ICOSPHERE_VERTICES, axis=1)[:, None]
+    # Pentagon center is the mean of centroids of 5 icosahedron triangles around the vertex.
+    centers = normals * radius * (5.0 + 2.0 * np.sqrt(5.0)) / 15.0
+    # Pentagon edge from dodecahedron circumradius (icosahedron inradius).
+    circumradius = radius * np.sqrt((5.0 + 2.0 * np.sqrt(5.0)) / 15.0)
+    edge = circumradius * 4.0 / (np.sqrt(3.0) * (1.0 + np.sqrt(5.0)))
+    areas = np.full(len(normals), edge * edge * np.sqrt(5.0 * (5.0 + 2.0 * np.sqrt(5.0))) / 4.0)
+    return centers, normals, areas
+
+# https://graphics.pixar.com/library/OrthonormalB/paper.pdf
+# Batched orthonormal basis around unit normals n (k,3).
+def pixar_onb(n):
+    sign = np.where(n[:, 2] < 0.0, -1.0, 1.0)
+    a = 1.0 / (1.0 + sign * n[:, 2])
+    b = -sign * n[:, 0] * n[:, 1] * a
+    t = np.stack((1.0 - n[:, 0] * n[:, 0] * a, sign * b, -sign * n[:, 0]), axis=1)
+    b = np.stack((b, sign * (1.0 - n[:, 1] * n[:, 1] * a), -n[:, 1]), axis=1)
+    return t, b
+
+# 4x4 TBN matrices with columns (t, b, n) for (k,3) array of normals.
+def tbn_matrices(n):
+    t, b = pixar_onb(n)
+    tbn = np.zeros((len(n), 4, 4))
+    tbn[:, :3, 0] = t
+    tbn[:, :3, 1] = b
+    tbn[:, :3, 2] = n
+    tbn[:, 3, 3] = 1.0
+    return tbn
+
+# Largest axis scale of each matrix, same as `max(obj.scale)` for `obj.matrix_basis`.
+def max_scale(matrices):
+    return np.linalg.norm(matrices[:, :3, :3], axis=1).max(axis=1)
+
+# Decompose (N,4,4) transforms into locations (N,3), XYZ euler rotations (N,3) and scales (N,3).
+# Euler angles follow Blender's "XYZ" order, R = Rz @ Ry @ Rx.
+def decompose(matrices):
+    locations = matrices[:, :3, 3]
+    scales = np.linalg.norm(matrices[:, :3, :3], axis=1)
+    r = matrices[:, :3, :3] / scales[:, None, :]
+    cos_y = np.sqrt(r[:, 0, 0] ** 2 + r[:, 1, 0] ** 2)
+    gimbal = cos_y < 1e-6
+    rotations = np.empty((len(matrices), 3))
+    rotations[:, 0] = np.where(gimbal, np.arctan2(-r[:, 1, 2], r[:, 1, 1]), np.arctan2(r[:, 2, 1], r[:, 2, 2]))
+    rotations[:, 1] = np.arctan2(-r[:, 2, 0], cos_y)
+    rotations[:, 2] = np.where(gimbal, 0.0, np.arctan2(r[:, 1, 0], r[:, 0, 0]))
+    return locations, rotations, scales
+
+# Transforms of children grown on faces `face_idx` of elements `parents` of the frontier.
+# Same as `basis @ translation @ scale @ tbn` from `generative.create_instance()`.
+def child_matrices(frontier, parents, face_idx, scales, face_centers, face_normals, face_tbn):
+    local = face_tbn[face_idx]
+    local[:, :3, :3] *= scales[:, None, None]
+    local[:, :3, 3] = face_centers[face_idx] + face_normals[face_idx] * scales[:, None] / 1.5 # touch with faces!
+    return np.matmul(frontier[parents], local)
+
+# Radius of the sphere inscribed in computational element, used for overlap tests.
+def element_radius(face_centers, face_areas):
+    return float(np.linalg.norm(face_centers[face_areas > MIN_FACE_AREA], axis=1).mean())
+
+# Ratio of the largest and smallest radius of elements in one band of `SpatialHash`.
+HASH_BAND_BASE = 4.0
+# Radii smaller than this fraction of the starting element radius share one band.
+HASH_MIN_RELATIVE_RADIUS = 1e-9
+HASH_PRIMES = np.array([73856093, 19349663, 83492791], dtype=np.int64)
+# Offsets of 2x2x2 cells around a point, towards the half of its cell the point is in.
+HASH_CELL_OFFSETS = np.stack(np.meshgrid([0, 1], [0, 1], [0, 1], indexing="ij"), axis=-1).reshape(-1, 3)
+
+# Hash of integer grid cells (n,3).
+def cell_hash(cells):
+    return np.bitwise_xor.reduce(cells * HASH_PRIMES, axis=1)
+
+# Sorted cell hashes and element indices of centers (n,3) on grid with given cell size.
+def hash_index(centers, cell_size):
+    hashes = cell_hash(np.floor(centers / cell_size).astype(np.int64))
+    order = np.argsort(hashes, kind="stable")
+    return hashes[order], order
+
+# All pairs (point index, center index) of spheres overlapping more than tolerance of summed radii.
+# Centers are given by their `hash_index()`, cell must be at least twice the largest overlap distance,
+# so each point visits 2x2x2 cells around it. Cells of all points are visited at once, k-th element of each cell per step.
+def grid_pairs(points, point_radii, centers, radii, index, cell_size, tolerance):
+    sorted_hashes, order = index
+    point_coords = points / cell_size
+    point_cells = np.floor(point_coords).astype(np.int64)
+    directions = np.where(point_coords - point_cells < 0.5, -1, 1)
+    point_pairs, center_pairs = [], []
+    for offset in HASH_CELL_OFFSETS:
+        hashes = cell_hash(point_cells + directions * offset)
+        starts = np.searchsorted(sorted_hashes, hashes, side="left")
+        counts = np.searchsorted(sorted_hashes, hashes, side="right") - starts
+        active = np.nonzero(counts > 0)[0]
+        k = 0
+        while len(active) > 0:
+            candidates = order[starts[active] + k]
+            hit = ((points[active] - centers[candidates]) ** 2).sum(axis=1) < ((point_radii[active] + radii[candidates]) * (1.0 - tolerance)) ** 2
+            point_pairs.append(active[hit])
+            center_pairs.append(candidates[hit])
+            k += 1
+            active = active[counts[active] > k]
+    if len(point_pairs) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # NOTE: hash collisions of neighbouring cells can visit the same element twice.
+    pairs = np.unique(np.stack((np.concatenate(point_pairs), np.concatenate(center_pairs)), axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+# Indices of points (n,3) inside box of centers (m,3) extended by margin.
+def points_near(points, centers, margin):
+    return np.nonzero(((points >= centers.min(axis=0) - margin) & (points <= centers.max(axis=0) + margin)).all(axis=1))[0]
+
+# Spatial hash over placed element centers and radii.
+# Elements are split into bands of similar radius (powers of HASH_BAND_BASE), since scale of elements shrinks with every
+# generation and one uniform grid would put late elements into a few crowded cells. Each band is a grid with cell of twice
+# the largest overlap distance of its elements with elements of the same or smaller band, stored as sorted cell hashes.
+# Queries are batched, all candidates are tested against each band at once.
+class SpatialHash:
+    def __init__(self, min_radius):
+        self.min_radius = min_radius
+        self.centers = np.zeros((0, 3))
+        self.radii = np.zeros(0)
+        self.bands = np.zeros(0, dtype=np.int64)
+        # Band -> element indices and their `hash_index()`.
+        self.indices = {}
+
+    def band(self, radii):
+        return np.floor(np.log(np.maximum(radii, self.min_radius)) / np.log(HASH_BAND_BASE)).astype(np.int64)
+
+    # Largest radius of band is HASH_BAND_BASE ** (band + 1), overlap distance of two such elements is at most twice that.
+    @staticmethod
+    def cell_size(band):
+        return 4.0 * HASH_BAND_BASE ** (band + 1)
+
+    def insert(self, centers, radii):
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+        radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+        bands = self.band(radii)
+        self.centers = np.concatenate((self.centers, centers))
+        self.radii = np.concatenate((self.radii, radii))
+        self.bands = np.concatenate((self.bands, bands))
+        # Only bands which got new elements are rehashed.
+        for band in np.unique(bands):
+            elements = np.nonzero(self.bands == band)[0]
+            self.indices[band] = (elements, hash_index(self.centers[elements], self.cell_size(band)))
+
+    # All pairs (query index, element index) of query spheres overlapping stored elements more than tolerance.
+    # tolerance - fraction of summed radii by which elements are allowed to intersect, in [0,1]
+    def overlapping_pairs(self, centers, radii, tolerance=0.1):
+        query_bands = self.band(radii)
+        query_pairs, element_pairs = [], []
+        for band, (elements, index) in self.indices.items():
+            cell_size = self.cell_size(band)
+            # Queries of the same or smaller band visit cells of the band.
+            queries = np.nonzero(query_bands <= band)[0]
+            queries = queries[points_near(centers[queries], self.centers[elements], 0.5 * cell_size)] if len(queries) > 0 else queries
+            if len(queries) > 0:
+                query_idx, element_idx = grid_pairs(centers[queries], radii[queries], self.centers[elements], self.radii[elements], index, cell_size, tolerance)
+                query_pairs.append(queries[query_idx])
+                element_pairs.append(elements[element_idx])
+            # Larger queries are hashed on their own grid and elements of the band visit it instead.
+            queries = np.nonzero(query_bands > band)[0]
+            if len(queries) > 0:
+                large_cell_size = 2.0 * (radii[queries].max() + self.radii[elements].max())
+                near = points_near(self.centers[elements], centers[queries], 0.5 * large_cell_size)
+                element_idx, query_idx = grid_pairs(self.centers[elements[near]], self.radii[elements[near]], centers[queries], radii[queries],
+                                                    hash_index(centers[queries], large_cell_size), large_cell_size, tolerance)
+                query_pairs.append(queries[query_idx])
+                element_pairs.append(elements[near[element_idx]])
+        if len(query_pairs) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(query_pairs), np.concatenate(element_pairs)
+
+    # Insert candidates skipping those that overlap already placed elements or earlier inserted candidates, same as inserting
+    # them one by one. Conflicts between candidates are resolved in rounds: candidate is rejected once an earlier candidate
+    # overlapping it is inserted and inserted once no earlier candidate overlapping it is undecided.
+    # Returns bool mask of inserted candidates.
+    def insert_non_overlapping(self, centers, radii, tolerance=0.1):
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+        radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+        candidates = np.ones(len(centers), dtype=bool)
+        candidates[self.overlapping_pairs(centers, radii, tolerance)[0]] = False
+        candidates = np.nonzero(candidates)[0]
+        conflicts = SpatialHash(self.min_radius)
+        conflicts.insert(centers[candidates], radii[candidates])
+        earlier, later = conflicts.overlapping_pairs(centers[candidates], radii[candidates], tolerance)
+        earlier, later = np.minimum(earlier, later), np.maximum(earlier, later)
+        earlier, later = earlier[earlier != later], later[earlier != later]
+        UNDECIDED, INSERTED, REJECTED = 0, 1, 2
+        state = np.full(len(candidates), UNDECIDED, dtype=np.int8)
+        while (state == UNDECIDED).any():
+            state[later[(state[earlier] == INSERTED) & (state[later] == UNDECIDED)]] = REJECTED
+            blocked = np.zeros(len(candidates), dtype=bool)
+            blocked[later[state[earlier] == UNDECIDED]] = True
+            state[(state == UNDECIDED) & ~blocked] = INSERTED
+        inserted = np.zeros(len(centers), dtype=bool)
+        inserted[candidates[state == INSERTED]] = True
+        self.insert(centers[inserted], radii[inserted])
+        return inserted
+
+    # Stored centers (n,3) and radii (n,).
+    def arrays(self):
+        return self.centers, self.radii
+
+    @staticmethod
+    def from_arrays(min_radius, centers, radii):
+        spatial_hash = SpatialHash(min_radius)
+        spatial_hash.insert(centers, radii)
+        return spatial_hash
+
+# Approximate bytes of one grown element: transform, base element index and light record.
+ELEMENT_BYTES = 16 * 8 + 8 + 2 * 8 * LIGHT_PROBABILITY
+
+# Independent random streams of growth decisions. Each decision type draws from its own stream, so e.g. changing the number
+# of base elements or lights does not change which faces grow and how large the elements are.
+RANDOM_STREAMS = ("faces", "scales", "budget", "prototypes", "lights")
+
+# Random generator of each stream in RANDOM_STREAMS, spawned from seed or from generator rng if given.
+def random_streams(seed=None, rng=None):
+    entropy = seed if rng is None else rng.integers(2 ** 63, size=4)
+    children = np.random.SeedSequence(entropy).spawn(len(RANDOM_STREAMS))
+    return {name: np.random.default_rng(child) for name, child in zip(RANDOM_STREAMS, children)}
+
+# Save growth state to checkpoint file, so growth can be resumed or extended with more iterations.
+def save_checkpoint(path, state):
+    arrays = {"frontier": state["frontier"]}
+    metadata = {key: state[key] for key in ("iteration", "face_grow_factor", "n_elements")}
+    metadata["rng_states"] = {name: rng.bit_generator.state for name, rng in state["rngs"].items()}
+    if state["spatial_hash"] is not None:
+        arrays["hash_centers"], arrays["hash_radii"] = state["spatial_hash"].arrays()
+        metadata["hash_min_radius"] = state["spatial_hash"].min_radius
+    binary_io.write_arrays(path, arrays, metadata)
+
+def load_checkpoint(path):
+    metadata, arrays = binary_io.read_arrays(path, mmap=False)
+    rngs = {}
+    for name, rng_state in metadata["rng_states"].items():
+        rngs[name] = np.random.default_rng()
+        rngs[name].bit_generator.state = rng_state
+    spatial_hash = None
+    if "hash_min_radius" in metadata:
+        spatial_hash = SpatialHash.from_arrays(metadata["hash_min_radius"], arrays["hash_centers"], arrays["hash_radii"])
+    return {"frontier": arrays["frontier"], "iteration": metadata["iteration"], "face_grow_factor": metadata["face_grow_factor"],
+            "n_elements": metadata["n_elements"], "rngs": rngs, "spatial_hash": spatial_hash}
+
+# Grow structure of transforms generation by generation.
+# face_centers, face_normals, face_areas - face table of computational element
+# n_iter - scalar, int e.g. n=1, total number of iterations, also when resuming
+# scale_range - vector, float e.g. (min=0.1, max=0.8)
+# n_prototypes - number of base elements from which display element is chosen randomly
+# start_matrix - 4x4 transform of starting element, identity if not given
+# light_prototypes - bool per base element, true if elements of this base element can get a light
+# n_lights - number of lights from which light is chosen randomly
+# collision_tolerance - if given, candidates overlapping placed elements more than this fraction of summed radii are rejected
+# seed - seed of all random decisions (faces, scales, base elements, lights), same seed and parameters give same structure,
+# each decision type has its own random stream, see `random_streams()`
+# rng - numpy random generator, streams are spawned from it instead of seed if given
+# max_elements, max_frontier, max_bytes - budgets of total elements, elements per generation and bytes of grown elements
+# budget_mode = {"thin", "stop"} - randomly thin generation to fit the budget or stop growth before it
+# checkpoint_path - if given, growth state is saved there after every checkpoint_every iterations
+# resume_from - checkpoint path to continue from, other parameters must be the same as for checkpointed growth
+# Yields dict of arrays for each generation, starting element is generation 0 (not yielded when resuming):
+# "generation" - generation index
+# "first_element" - element index of first element in this generation
+# "matrices" (n,4,4) - transform of each element
+# "prototypes" (n,) - base element index of each element
+# "light_elements" (l,) - element index of each light
+# "light_indices" (l,) - light index of each light
+# "generations" (n,) - generation index of each element
+# "parents" (n,) - element index of parent of each element, -1 for starting element
+def grow_generations(face_centers, face_normals, face_areas, n_iter=3, scale_range=(0.8, 1.0), n_prototypes=1,
+                     face_grow_factor_per_iter=0.7, start_matrix=None, light_prototypes=None, n_lights=0, collision_tolerance=None, seed=None, rng=None,
+                     max_elements=None, max_frontier=None, max_bytes=None, budget_mode="thin", checkpoint_path=None, checkpoint_every=1, resume_from=None):
+    face_centers = np.asarray(face_centers, dtype=np.float64)
+    face_normals = np.asarray(face_normals, dtype=np.float64)
+    face_areas = np.asarray(face_areas, dtype=np.float64)
+    if light_prototypes is None or n_lights == 0:
+        light_prototypes = np.zeros(n_prototypes, dtype=bool)
+    light_prototypes = np.asarray(light_prototypes, dtype=bool)
+    # NOTE: budget of 0 means no growth, only a missing budget (None) is unlimited.
+    max_elements = np.inf if max_elements is None else max_elements
+    max_frontier = np.inf if max_frontier is None else max_frontier
+    if max_bytes is not None:
+        max_elements = min(max_elements, int(max_bytes // ELEMENT_BYTES))
+    # Face filtering and TBN are the same for each element, so compute them once.
+    growing_faces = (face_areas > MIN_FACE_AREA) & (face_normals[:, 2] >= MIN_FACE_NORMAL_Z)
+    face_tbn = tbn_matrices(face_normals)
+    radius = element_radius(face_centers, face_areas)
+    if resume_from is not None:
+        state = load_checkpoint(resume_from)
+    else:
+        rngs = random_streams(seed, rng)
+        if start_matrix is None:
+            start_matrix = np.identity(4)
+        # Starting element.
+        frontier = np.asarray(start_matrix, dtype=np.float64).reshape(1, 4, 4)
+        spatial_hash = None
+        if collision_tolerance is not None:
+            spatial_hash = SpatialHash(min_radius=HASH_MIN_RELATIVE_RADIUS * radius * max_scale(frontier)[0])
+            spatial_hash.insert(frontier[:, :3, 3], radius * max_scale(frontier))
+        empty = np.zeros(0, dtype=np.int64)
+        yield {"generation": 0, "first_element": 0, "matrices": frontier, "prototypes": rngs["prototypes"].integers(n_prototypes, size=1),
+               "light_elements": empty, "light_indices": empty, "generations": np.zeros(1, dtype=np.int64), "parents": np.full(1, -1)}
+        state = {"frontier": frontier, "iteration": 0, "n_elements": 1, "rngs": rngs, "spatial_hash": spatial_hash,
+                 "face_grow_factor": 1.0} # First iteration starts with the default value. Each next can have smaller or larger factor
+    rngs = state["rngs"]
+    spatial_hash = state["spatial_hash"]
+    frontier = state["frontier"]
+    n_elements = state["n_elements"]
+    face_grow_factor = state["face_grow_factor"]
+    for iter_i in range(state["iteration"], n_iter):
+        if len(frontier) == 0:
+            break
+        # Budget is already used up, no candidates are computed.
+        budget = min(max_frontier, max_elements - n_elements)
+        if budget <= 0:
+            break
+        iteration_start = time.perf_counter()
+        n_frontier = len(frontier)
+        frontier_first = n_elements - n_frontier
+        # Choose faces of all frontier elements at once.
+        chosen = (rngs["faces"].random((len(frontier), len(face_areas))) < face_grow_factor) & growing_faces
+        parents, face_idx = np.nonzero(chosen)
+        scales = max_scale(frontier)[parents] * ((scale_range[1] - scale_range[0]) * rngs["scales"].random(len(parents)) + scale_range[0])
+        frontier = child_matrices(frontier, parents, face_idx, scales, face_centers, face_normals, face_tbn)
+        # Candidates and face grow factor of this iteration, before budgets and collisions remove some of them.
+        n_candidates = len(parents)
+        used_face_grow_factor = face_grow_factor
+        # Budgets.
+        if len(frontier) > budget:
+            if budget_mode == "stop":
+                break
+            keep = np.sort(rngs["budget"].choice(len(frontier), size=int(budget), replace=False))
+            frontier, parents = frontier[keep], parents[keep]
+        if spatial_hash is not None:
+            # Overlapping candidates are never instanced and never grow further.
+            keep = spatial_hash.insert_non_overlapping(frontier[:, :3, 3], radius * max_scale(frontier), collision_tolerance)
+            frontier, parents = frontier[keep], parents[keep]
+        # Choose random base element and light for each new element.
+        prototypes = rngs["prototypes"].integers(n_prototypes, size=len(frontier))
+        with_light = light_prototypes[prototypes] & (rngs["lights"].random(len(frontier)) < LIGHT_PROBABILITY)
+        light_elements = n_elements + np.nonzero(with_light)[0]
+        light_indices = rngs["lights"].integers(max(n_lights, 1), size=int(with_light.sum()))
+        generation = {"generation": iter_i + 1, "first_element": n_elements, "matrices": frontier, "prototypes": prototypes,
+                      "light_elements": light_elements, "light_indices": light_indices,
+                      "generations": np.full(len(frontier), iter_i + 1), "parents": frontier_first + parents}
+        n_elements += len(frontier)
+        face_grow_factor = max(face_grow_factor * face_grow_factor_per_iter, MIN_FACE_GROW_FACTOR)
+        if checkpoint_path is not None and ((iter_i + 1) % checkpoint_every == 0 or iter_i + 1 == n_iter):
+            save_checkpoint(checkpoint_path, {"frontier": frontier, "iteration": iter_i + 1, "face_grow_factor": face_grow_factor,
+                                              "n_elements": n_elements, "rngs": rngs, "spatial_hash": spatial_hash})
+        seconds = time.perf_counter() - iteration_start
+        profiling.add("growth_iteration", seconds=seconds, elements=len(frontier))
+        profiling.iteration({"iteration": iter_i + 1, "seconds": seconds, "frontier": n_frontier, "candidates": n_candidates,
+                             "elements": len(frontier), "lights": len(light_elements), "face_grow_factor": used_face_grow_factor})
+        yield generation
+
+# Grow structure of transforms, same parameters as `grow_generations()`.
+# Returns dict of arrays:
+# "matrices" (N,4,4) - transform of each element, element 0 is the starting element
+# "prototypes" (N,) - base element index of each element
+# "light_elements" (L,) - element index of each light
+# "light_indices" (L,) - light index of each light
+# "generations" (N,) - generation index of each element
+# "parents" (N,) - element index of parent of each element, -1 for starting element
+def grow_transforms(face_centers, face_normals, face_areas, **kwargs):
+    return concatenate_generations(grow_generations(face_centers, face_normals, face_areas, **kwargs))
+
+# Arrays of grown structure.
+STRUCTURE_KEYS = ("matrices", "prototypes", "light_elements", "light_indices", "generations", "parents")
+
+# Join generations into one structure.
+def concatenate_generations(generations):
+    generations = list(generations)
+    structure = {}
+    for key in STRUCTURE_KEYS:
+        arrays = [generation[key] for generation in generations]
+        structure[key] = np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64)
+    return structure
+
+# Structure with compact dtypes for transfer between processes and storage.
+def compact(structure):
+    return {
+        "matrices": structure["matrices"].astype(np.float32),
+        "prototypes": structure["prototypes"].astype(np.int32),
+        "light_elements": structure["light_elements"].astype(np.int32),
+        "light_indices": structure["light_indices"].astype(np.int32),
+        "generations": structure["generations"].astype(np.int32),
+        "parents": structure["parents"].astype(np.int32),
+    }
+
+# Join several structures into one, element indices of later structures are offset.
+def merge_structures(structures):
+    merged = {key: [] for key in STRUCTURE_KEYS}
+    n_elements = 0
+    for structure in structures:
+        for key in STRUCTURE_KEYS:
+            array = structure[key]
+            if key == "light_elements":
+                array = array + n_elements
+            if key == "parents":
+                array = np.where(array >= 0, array + n_elements, -1)
+            merged[key].append(array)
+        n_elements += len(structure["matrices"])
+    return {key: np.concatenate(arrays) for key, arrays in merged.items()}
+
+# Default LOD thresholds of each mode of `select_lods()`, units differ between modes.
+LOD_THRESHOLDS = {"scale": (0.5, 0.25), "depth": (6, 10), "screen": (64, 16)}
+
+# Level of detail of each element of structure, 0 is full detail, len(thresholds) is the coarsest level.
+# mode = {"scale", "depth", "screen"}
+# - "scale": element scale, thresholds descending e.g. (0.5, 0.25) - elements smaller than 0.5 use level 1, smaller than 0.25 level 2,
+# - "depth": generation, thresholds ascending e.g. (6, 10) - elements from generation 6 use level 1, from generation 10 level 2,
+# - "screen": projected diameter in pixels, thresholds descending e.g. (64, 16), needs camera.
+# thresholds - None uses LOD_THRESHOLDS of the mode
+# camera_matrix - (4,4) camera to world transform, camera looks along its -Z axis
+# focal_length - focal length in pixels
+# radius - radius of element with scale 1
+def select_lods(structure, thresholds=None, mode="scale", camera_matrix=None, focal_length=None, radius=1.0):
+    if mode not in LOD_THRESHOLDS:
+        raise ValueError("Unknown LOD mode: " + str(mode))
+    if thresholds is None:
+        thresholds = LOD_THRESHOLDS[mode]
+    matrices = np.asarray(structure["matrices"])
+    if mode == "depth":
+        return (np.asarray(structure["generations"])[:, None] >= np.asarray(thresholds)[None, :]).sum(axis=1)
+    sizes = max_scale(matrices)
+    if mode == "screen":
+        camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        depths = (matrices[:, :3, 3] - camera_matrix[:3, 3]) @ -camera_matrix[:3, 2]
+        # Elements behind the camera get the coarsest level.
+        sizes = np.where(depths > 0.0, 2.0 * radius * sizes * focal_length / np.maximum(depths, 1e-6), 0.0)
+    return (sizes[:, None] < np.asarray(thresholds)[None, :]).sum(axis=1)
+
+# Shortest growth of an element in frames, elements with grow_frames of 0 appear at once.
+MIN_GROW_FRAMES = 0.01
+
+# Frames of growth animation. Each generation is born frames_per_generation after the previous one and grows
+# from zero to full size in grow_frames (frames_per_generation by default), starting at the face of its parent.
+# Returns birth frame (N,), frame when element is fully grown (N,) and origin of growth (N,3) of each element.
+def growth_animation(structure, frame_start=1, frames_per_generation=10, grow_frames=None):
+    matrices = np.asarray(structure["matrices"], dtype=np.float64)
+    generations = np.asarray(structure["generations"])
+    birth_frames = frame_start + generations * frames_per_generation
+    # NOTE: zero duration would divide by zero in points instancer and put both keyframes on one frame.
+    grown_frames = birth_frames + max(frames_per_generation if grow_frames is None else grow_frames, MIN_GROW_FRAMES)
+    # Child is moved by its scaled face normal / 1.5 from parent face and its local z axis is that normal,
+    # see `child_matrices()`. Starting elements grow from their center.
+    origins = matrices[:, :3, 3] - np.where(generations[:, None] > 0, matrices[:, :3, 2] / 1.5, 0.0)
+    return birth_frames, grown_frames, origins
+
+# Job is a dict of `grow_transforms()` keyword arguments, including face table and seed.
+def grow_job(job):
+    return compact(grow_transforms(**job))
+
+# Grow many structures in a process pool. Returns compact structures in order of jobs.
+# NOTE: inside Blender pass `multiprocessing.get_context("fork")` as mp_context, spawned workers would import
+# the main script and with it bpy, which is not available to them.
+def grow_batch(jobs, max_workers=None, mp_context=None):
+    if max_workers == 1:
+        return [grow_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context) as executor:
+        return list(executor.map(grow_job, jobs))
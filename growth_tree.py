@@ -0,0 +1,215 @@
+#
+# Growth history as an explicit tree with incremental regrowth: pure NumPy, no bpy/mathutils.
+# Author: Lovro Bosnar
+#
+# Every node (element) stores its parent, the parent face it grew on, its generation and transform.
+# Random decisions of a node are not drawn from a shared generator but hashed from the seed and the node's
+# path (sequence of faces from the root), so each node has its own random stream. Changing parameters from
+# generation k onwards or regrowing one branch recomputes only the affected subtrees and all other nodes come
+# out exactly the same, so instances of them can be reused (see `generative.instance_tree()`).
+#
+# NOTE: collision rejection and budgets of `growth.grow_generations()` depend on the order in which
+# elements are placed and are not supported here.
+#
+
+import numpy as np
+
+import growth
+
+# Random streams of a node.
+STREAM_FACE = np.uint64(0x1F0A)
+STREAM_SCALE = np.uint64(0x2E5C)
+STREAM_PROTOTYPE = np.uint64(0x3D7B)
+STREAM_LIGHT = np.uint64(0x4C93)
+STREAM_LIGHT_INDEX = np.uint64(0x5B21)
+STREAM_VARIATION = np.uint64(0x6A4F) # see `generative.element_variation()`
+
+# https://prng.di.unimi.it/splitmix64.c
+def splitmix64(x):
+    x = np.asarray(x, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+# Uniform floats in [0,1) of given random stream of nodes.
+def uniform(keys, stream):
+    return (splitmix64(keys ^ stream) >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+def root_key(seed):
+    return splitmix64(np.array([seed], dtype=np.uint64))
+
+# Keys of children growing on faces of nodes: (n,) keys -> (n,n_faces) keys.
+def child_keys(keys, n_faces):
+    face_salts = splitmix64(np.arange(1, n_faces + 1, dtype=np.uint64))
+    return splitmix64(keys[:, None] ^ face_salts[None, :])
+
+# Parameters of growth, stored per generation in tree["params"].
+def growth_params(scale_range=(0.8, 1.0), n_prototypes=1, face_grow_factor_per_iter=0.7, light_prototypes=None, n_lights=0):
+    if light_prototypes is None or n_lights == 0:
+        light_prototypes = [False] * n_prototypes
+    if len(light_prototypes) != n_prototypes:
+        raise ValueError("light_prototypes must have one value per prototype")
+    return {"scale_range": tuple(scale_range), "n_prototypes": n_prototypes, "face_grow_factor_per_iter": face_grow_factor_per_iter,
+            "light_prototypes": list(light_prototypes), "n_lights": n_lights}
+
+# Base element and light of nodes.
+def choose_prototypes_and_lights(keys, params):
+    prototypes = np.minimum((uniform(keys, STREAM_PROTOTYPE) * params["n_prototypes"]).astype(np.int64), params["n_prototypes"] - 1)
+    with_light = np.asarray(params["light_prototypes"], dtype=bool)[prototypes] & (uniform(keys, STREAM_LIGHT) < growth.LIGHT_PROBABILITY)
+    light_indices = np.minimum((uniform(keys, STREAM_LIGHT_INDEX) * max(params["n_lights"], 1)).astype(np.int64), max(params["n_lights"], 1) - 1)
+    return prototypes, np.where(with_light, light_indices, -1)
+
+# Grow tree from seed, same parameters as `growth.grow_generations()`.
+# Returns tree dict:
+# "keys" (N,) uint64 - random stream key of each node, derived from seed and path
+# "parents" (N,) - parent node index, -1 for root
+# "faces" (N,) - parent face index the node grew on, -1 for root
+# "generations" (N,) - generation of each node, nodes are ordered by generation
+# "matrices" (N,4,4), "prototypes" (N,), "lights" (N,) - transform, base element and light index (-1 for none) of each node
+# "params" - growth parameters used for each generation, "face_grow_factors" - face grow factor used for each generation
+def grow_tree(face_centers, face_normals, face_areas, n_iter=3, scale_range=(0.8, 1.0), n_prototypes=1, face_grow_factor_per_iter=0.7,
+              start_matrix=None, light_prototypes=None, n_lights=0, seed=0):
+    params = growth_params(scale_range, n_prototypes, face_grow_factor_per_iter, light_prototypes, n_lights)
+    if start_matrix is None:
+        start_matrix = np.identity(4)
+    keys = root_key(seed)
+    prototypes, lights = choose_prototypes_and_lights(keys, params)
+    tree = {
+        "face_centers": np.asarray(face_centers, dtype=np.float64),
+        "face_normals": np.asarray(face_normals, dtype=np.float64),
+        "face_areas": np.asarray(face_areas, dtype=np.float64),
+        "keys": keys, "parents": np.full(1, -1), "faces": np.full(1, -1), "generations": np.zeros(1, dtype=np.int64),
+        "matrices": np.asarray(start_matrix, dtype=np.float64).reshape(1, 4, 4), "prototypes": prototypes, "lights": np.full(1, -1),
+        "params": [params], "face_grow_factors": [1.0],
+    }
+    set_schedule(tree, n_iter, params, from_generation=1)
+    return grow_subtrees(tree, np.zeros(1, dtype=np.int64))
+
+# Parameters and face grow factors of generations from_generation..n_iter.
+# First iteration starts with the default value. Each next can have smaller or larger factor.
+def set_schedule(tree, n_iter, params, from_generation):
+    tree["params"] = tree["params"][:from_generation] + [params] * (n_iter + 1 - from_generation)
+    tree["face_grow_factors"] = tree["face_grow_factors"][:from_generation]
+    for generation in range(from_generation, n_iter + 1):
+        factor = 1.0 if generation == 1 else max(tree["face_grow_factors"][-1] * params["face_grow_factor_per_iter"], growth.MIN_FACE_GROW_FACTOR)
+        tree["face_grow_factors"].append(factor)
+
+# Grow descendants of given nodes (which must not have children) up to the last generation of the schedule.
+def grow_subtrees(tree, frontier_idx):
+    face_centers, face_normals, face_areas = tree["face_centers"], tree["face_normals"], tree["face_areas"]
+    growing_faces = (face_areas > growth.MIN_FACE_AREA) & (face_normals[:, 2] >= growth.MIN_FACE_NORMAL_Z)
+    face_tbn = growth.tbn_matrices(face_normals)
+    n_iter = len(tree["params"]) - 1
+    new_nodes = []
+    n_nodes = len(tree["keys"])
+    frontier_keys = tree["keys"][frontier_idx]
+    frontier = tree["matrices"][frontier_idx]
+    frontier_generations = tree["generations"][frontier_idx]
+    while len(frontier_idx) > 0:
+        # Frontier can mix generations when regrowing branches.
+        generations = frontier_generations + 1
+        active = generations <= n_iter
+        frontier_idx, frontier_keys, frontier, generations = frontier_idx[active], frontier_keys[active], frontier[active], generations[active]
+        if len(frontier_idx) == 0:
+            break
+        factors = np.array(tree["face_grow_factors"])[generations]
+        keys = child_keys(frontier_keys, len(face_areas))
+        chosen = (uniform(keys, STREAM_FACE) < factors[:, None]) & growing_faces
+        parents, face_idx = np.nonzero(chosen)
+        keys = keys[parents, face_idx]
+        generations = generations[parents]
+        scale_ranges = np.array([tree["params"][generation]["scale_range"] for generation in range(n_iter + 1)])[generations]
+        scales = growth.max_scale(frontier)[parents] * ((scale_ranges[:, 1] - scale_ranges[:, 0]) * uniform(keys, STREAM_SCALE) + scale_ranges[:, 0])
+        matrices = growth.child_matrices(frontier, parents, face_idx, scales, face_centers, face_normals, face_tbn)
+        prototypes = np.zeros(len(keys), dtype=np.int64)
+        lights = np.full(len(keys), -1)
+        for generation in np.unique(generations):
+            in_generation = generations == generation
+            prototypes[in_generation], lights[in_generation] = choose_prototypes_and_lights(keys[in_generation], tree["params"][generation])
+        new_nodes.append({"keys": keys, "parents": frontier_idx[parents], "faces": face_idx, "generations": generations,
+                          "matrices": matrices, "prototypes": prototypes, "lights": lights})
+        frontier_idx = n_nodes + np.arange(len(keys))
+        frontier_keys, frontier, frontier_generations = keys, matrices, generations
+        n_nodes += len(keys)
+    for key in NODE_KEYS:
+        tree[key] = np.concatenate([tree[key]] + [nodes[key] for nodes in new_nodes])
+    return sort_by_generation(tree)
+
+# Per node arrays of tree.
+NODE_KEYS = ("keys", "parents", "faces", "generations", "matrices", "prototypes", "lights")
+
+# Keep only nodes in mask, parents are reindexed.
+def select_nodes(tree, mask):
+    new_index = np.cumsum(mask) - 1
+    tree = dict(tree)
+    for key in NODE_KEYS:
+        tree[key] = tree[key][mask]
+    tree["parents"] = np.where(tree["parents"] >= 0, new_index[np.maximum(tree["parents"], 0)], -1)
+    return tree
+
+# Stable order by generation, so parents always come before children.
+def sort_by_generation(tree):
+    order = np.argsort(tree["generations"], kind="stable")
+    new_index = np.empty_like(order)
+    new_index[order] = np.arange(len(order))
+    tree = dict(tree)
+    for key in NODE_KEYS:
+        tree[key] = tree[key][order]
+    tree["parents"] = np.where(tree["parents"] >= 0, new_index[np.maximum(tree["parents"], 0)], -1)
+    return tree
+
+# Bool mask of descendants of node (without the node itself).
+def descendants(tree, node):
+    in_subtree = np.zeros(len(tree["keys"]), dtype=bool)
+    in_subtree[node] = True
+    for generation in range(int(tree["generations"][node]) + 1, int(tree["generations"].max()) + 1):
+        in_generation = np.nonzero(tree["generations"] == generation)[0]
+        in_subtree[in_generation] = in_subtree[tree["parents"][in_generation]]
+    in_subtree[node] = False
+    return in_subtree
+
+# Parameters of base element and light choice, see `choose_prototypes_and_lights()`.
+PROTOTYPE_PARAMS = ("n_prototypes", "light_prototypes", "n_lights")
+
+# Regrow generations from_generation onwards with changed parameters (any of `growth_params()` arguments and n_iter).
+# Nodes of earlier generations are kept, nodes whose random decisions and parameters did not change come out the same.
+def regrow(tree, from_generation=1, n_iter=None, **changed_params):
+    from_generation = max(from_generation, 1)
+    if n_iter is None:
+        n_iter = len(tree["params"]) - 1
+    params = growth_params(**dict(tree["params"][-1], **changed_params))
+    tree = select_nodes(tree, tree["generations"] < from_generation)
+    # Transforms of the kept nodes do not depend on base elements and lights, but if their number changed the old choice
+    # can point past the new lists, so it is made again from the node keys with new parameters.
+    if any(tree["params"][generation][key] != params[key] for generation in range(from_generation) for key in PROTOTYPE_PARAMS):
+        tree["prototypes"], lights = choose_prototypes_and_lights(tree["keys"], params)
+        tree["lights"] = np.where(tree["generations"] > 0, lights, -1)
+        tree["params"] = [dict(generation_params, **{key: params[key] for key in PROTOTYPE_PARAMS}) for generation_params in tree["params"]]
+    set_schedule(tree, n_iter, params, from_generation)
+    return grow_subtrees(tree, np.nonzero(tree["generations"] == from_generation - 1)[0])
+
+# Remove node and its whole subtree.
+def prune(tree, node):
+    mask = ~descendants(tree, node)
+    mask[node] = False
+    return select_nodes(tree, mask)
+
+# Regrow subtree of node with new random stream given by salt, the node itself stays.
+def regrow_branch(tree, node, salt=1):
+    # NOTE: descendants come after the node, so its index does not change.
+    tree = select_nodes(tree, ~descendants(tree, node))
+    tree["keys"] = tree["keys"].copy()
+    tree["keys"][node] = splitmix64(tree["keys"][node:node + 1] ^ splitmix64(np.array([salt], dtype=np.uint64)))[0]
+    return grow_subtrees(tree, np.array([node]))
+
+# Structure of tree in the same form as `growth.grow_transforms()` returns, for instancing and export.
+def tree_structure(tree):
+    with_light = tree["lights"] >= 0
+    return {
+        "matrices": tree["matrices"],
+        "prototypes": tree["prototypes"],
+        "light_elements": np.nonzero(with_light)[0],
+        "light_indices": tree["lights"][with_light],
+        "generations": tree["generations"],
+        "parents": tree["parents"],
+    }
@@ -0,0 +1,105 @@
+#
+# Light placement of grown structures: pure NumPy, no bpy/mathutils.
+# Author: Lovro Bosnar
+#
+# Growth places a point light candidate in some of the elements with holes, so number of lights grows with the
+# structure. Placement merges nearby candidates on a regular grid into single lights with summed energy placed
+# in the energy-weighted centroid. Grid cell is grown until number of lights fits the budget.
+#
+
+import numpy as np
+
+# Positions (L,3) and energies (L,) of light candidates of structure.
+# light_energies - energy of each light prototype, indexed by "light_indices"
+# first_element - element index of first element in structure, when only part of a structure is given
+def light_candidates(structure, light_energies, first_element=0):
+    elements = np.asarray(structure["light_elements"], dtype=np.int64) - first_element
+    positions = np.asarray(structure["matrices"], dtype=np.float64)[elements, :3, 3].reshape(-1, 3)
+    energies = np.asarray(light_energies, dtype=np.float64)[np.asarray(structure["light_indices"], dtype=np.int64)]
+    return positions, energies
+
+# Steps refining grid cell between the last too fine and the first fitting cell.
+BISECTION_STEPS = 8
+
+# Cluster label of each position on grid with given origin and cell size.
+def grid_labels(positions, origin, cell_size):
+    cells = np.floor((positions - origin) / cell_size).astype(np.int64)
+    return np.unique(cells, axis=0, return_inverse=True)[1].ravel()
+
+# Energy-weighted mean of values (L,k) per cluster.
+def cluster_means(values, energies, labels, n_clusters):
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    sums = np.zeros((n_clusters, values.shape[1]))
+    np.add.at(sums, labels, values * energies[:, None])
+    cluster_energies = np.bincount(labels, weights=energies, minlength=n_clusters)
+    return sums / np.maximum(cluster_energies, 1e-12)[:, None]
+
+# Merge light candidates into at most max_lights lights.
+# cell_size - starting grid cell, by default fine enough that candidates are not merged before they must be
+# Returns light positions (n,3), energies (n,), radii (n,) - energy-weighted RMS distance of merged candidates,
+# cluster label of each candidate (L,), -1 if max_lights is 0, and final cell size (None if nothing was merged).
+def cluster_lights(positions, energies, max_lights, cell_size=None):
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    energies = np.asarray(energies, dtype=np.float64)
+    n_candidates = len(positions)
+    if max_lights is None or n_candidates <= max_lights:
+        return positions, energies, np.zeros(n_candidates), np.arange(n_candidates), None
+    if max_lights <= 0:
+        return np.zeros((0, 3)), np.zeros(0), np.zeros(0), np.full(n_candidates, -1), None
+    origin = positions.min(axis=0)
+    extent = (positions.max(axis=0) - origin).max()
+    if cell_size is None:
+        cell_size = max(extent, 1e-6) / (2.0 * np.ceil(max_lights ** (1.0 / 3.0)))
+    # Double the cell until lights fit the budget, then bisect between the last two cells to use as much of it as possible.
+    labels = grid_labels(positions, origin, cell_size)
+    fine_cell_size = cell_size
+    while labels.max() + 1 > max_lights:
+        fine_cell_size = cell_size
+        cell_size *= 2.0
+        labels = grid_labels(positions, origin, cell_size)
+    for _ in range(BISECTION_STEPS if fine_cell_size < cell_size else 0):
+        middle_cell_size = 0.5 * (fine_cell_size + cell_size)
+        middle_labels = grid_labels(positions, origin, middle_cell_size)
+        if middle_labels.max() + 1 <= max_lights:
+            cell_size, labels = middle_cell_size, middle_labels
+        else:
+            fine_cell_size = middle_cell_size
+    n_clusters = labels.max() + 1
+    light_positions = cluster_means(positions, energies, labels, n_clusters)
+    light_energies = np.bincount(labels, weights=energies, minlength=n_clusters)
+    squared_distances = ((positions - light_positions[labels]) ** 2).sum(axis=1)
+    light_radii = np.sqrt(cluster_means(squared_distances, energies, labels, n_clusters)[:, 0])
+    return light_positions, light_energies, light_radii, labels, cell_size
+
+# Irradiance (inverse square falloff) of point lights at sample points, distances below min_distance are clamped.
+def irradiance(points, light_positions, light_energies, min_distance=1.0):
+    squared_distances = ((points[:, None, :] - light_positions[None, :, :]) ** 2).sum(axis=2)
+    return (light_energies[None, :] / (4.0 * np.pi * np.maximum(squared_distances, min_distance ** 2))).sum(axis=1)
+
+# Error introduced by clustering.
+# samples - (S,3) points where lighting is compared, e.g. element locations, at most max_samples of them are used
+# Returns dict: number of candidates and lights, total energy before and after, energy-weighted mean and max displacement
+# of candidates and relative RMS error of irradiance at sample points.
+def clustering_report(positions, energies, labels, light_positions, light_energies, samples=None, max_samples=1024, min_distance=1.0):
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    energies = np.asarray(energies, dtype=np.float64)
+    kept = labels >= 0
+    displacements = np.linalg.norm(positions[kept] - light_positions[labels[kept]], axis=1) if kept.any() else np.zeros(0)
+    report = {
+        "candidates": len(positions),
+        "lights": len(light_positions),
+        "energy_before": float(energies.sum()),
+        "energy_after": float(np.sum(light_energies)),
+        "mean_displacement": float(np.average(displacements, weights=energies[kept])) if energies[kept].sum() > 0 else 0.0,
+        "max_displacement": float(displacements.max()) if len(displacements) else 0.0,
+        "irradiance_error": 0.0,
+    }
+    if samples is not None and len(samples) > 0 and len(positions) > 0:
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, 3)
+        samples = samples[np.linspace(0, len(samples) - 1, min(len(samples), max_samples)).astype(np.int64)]
+        reference = irradiance(samples, positions, energies, min_distance)
+        clustered = irradiance(samples, light_positions, light_energies, min_distance)
+        report["irradiance_error"] = float(np.sqrt(np.mean((clustered - reference) ** 2)) / max(np.sqrt(np.mean(reference ** 2)), 1e-12))
+    return report
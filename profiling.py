@@ -0,0 +1,69 @@
+#
+# Phase-level profiling of generation runs.
+# Author: Lovro Bosnar
+#
+# Records wall time, call counts and element counts per phase and per growth iteration.
+# Phases can be nested, time of a phase includes time of phases inside it.
+# Profiling is off by default and then every call is a no-op, enable it with `enable()`.
+#
+
+import json
+import time
+from contextlib import contextmanager
+
+# Active profiler, None if profiling is disabled.
+PROFILER = None
+
+class Profiler:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.iterations = []
+
+    def add(self, name, seconds=0.0, calls=1, elements=0):
+        phase = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0, "elements": 0})
+        phase["seconds"] += seconds
+        phase["calls"] += calls
+        phase["elements"] += elements
+
+    def report(self):
+        return {"total_seconds": time.perf_counter() - self.start, "phases": self.phases, "iterations": self.iterations}
+
+def enable():
+    global PROFILER
+    PROFILER = Profiler()
+    return PROFILER
+
+def disable():
+    global PROFILER
+    PROFILER = None
+
+# Time block of code as phase. Yields dict where number of processed elements can be stored under "elements".
+@contextmanager
+def phase(name):
+    record = {"elements": 0}
+    if PROFILER is None:
+        yield record
+        return
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        PROFILER.add(name, seconds=time.perf_counter() - start, elements=record["elements"])
+
+# Add measurement to phase, used where context manager does not fit (e.g. generators) and for cheap calls made many times.
+def add(name, seconds=0.0, calls=1, elements=0):
+    if PROFILER is not None:
+        PROFILER.add(name, seconds=seconds, calls=calls, elements=elements)
+
+# Record statistics of one growth iteration (dict of numbers).
+def iteration(record):
+    if PROFILER is not None:
+        PROFILER.iterations.append(record)
+
+def report():
+    return PROFILER.report() if PROFILER is not None else {}
+
+def write_report(path):
+    with open(path, "w") as f:
+        json.dump(report(), f, indent=2)
@@ -0,0 +1,39 @@
+#
+# On-disk cache of base element prototype meshes.
+# Author: Lovro Bosnar
+#
+# Prototype geometry is fully determined by its generator and generator parameters, so mesh arrays
+# (vertices, faces, UVs) are stored under a hash of those and reused by later runs.
+#
+
+import hashlib
+import json
+import os
+
+import binary_io
+
+# Bump when any prototype generator changes its output geometry or UVs.
+CODE_VERSION = 3
+
+# Cache key of prototype created by generator with given geometry parameters.
+def prototype_key(generator_name, params):
+    description = json.dumps({"generator": generator_name, "params": params, "version": CODE_VERSION}, sort_keys=True)
+    return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+def prototype_path(cache_dir, key):
+    return os.path.join(cache_dir, key + ".proto")
+
+# Mesh arrays of cached prototype or None if prototype is not cached.
+def load_prototype(cache_dir, key):
+    path = prototype_path(cache_dir, key)
+    if not os.path.exists(path):
+        return None
+    return binary_io.read_arrays(path)[1]
+
+def save_prototype(cache_dir, key, arrays, metadata={}):
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to temporary file first so concurrent farm jobs never read partial prototype.
+    path = prototype_path(cache_dir, key)
+    tmp_path = path + "." + str(os.getpid()) + ".tmp"
+    binary_io.write_arrays(tmp_path, arrays, metadata)
+    os.replace(tmp_path, path)
@@ -0,0 +1,58 @@
+#
+# Compact export/import of grown structures.
+# Author: Lovro Bosnar
+#
+# Structure is stored in a memory-mapped array file (see `binary_io.py`):
+#   transforms (N,3,4) float32 - top three rows of each element transform
+#   prototypes (N,) uint16 - base element index
+#   generations (N,) uint16 - generation depth
+#   parents (N,) int32 - parent element index, -1 for starting elements
+#   light_elements (L,) int32, light_indices (L,) uint16 - light records
+# Header holds format version, seed and growth parameters. Loading touches only the requested slice,
+# so a farm node can instance part of a million element structure without reading all of it.
+#
+
+import numpy as np
+
+import binary_io
+
+FORMAT_VERSION = 1
+
+# metadata - JSON serializable dict, e.g. {"seed": 0, "params": {...}, "prototype_names": [...]}
+def export_structure(path, structure, metadata={}):
+    matrices = np.asarray(structure["matrices"])
+    arrays = {
+        "transforms": matrices[:, :3, :].astype(np.float32),
+        "prototypes": np.asarray(structure["prototypes"]).astype(np.uint16),
+        "generations": np.asarray(structure["generations"]).astype(np.uint16),
+        "parents": np.asarray(structure["parents"]).astype(np.int32),
+        "light_elements": np.asarray(structure["light_elements"]).astype(np.int32),
+        "light_indices": np.asarray(structure["light_indices"]).astype(np.uint16),
+    }
+    metadata = dict(metadata, format_version=FORMAT_VERSION, n_elements=len(matrices), n_lights=len(arrays["light_elements"]))
+    binary_io.write_arrays(path, arrays, metadata)
+
+# Load elements [start, stop) of exported structure.
+# Returns metadata and structure with (n,4,4) matrices, light elements stay global indices, see "first_element".
+def import_structure(path, start=0, stop=None):
+    metadata, arrays = binary_io.read_arrays(path, mmap=True)
+    if metadata.get("format_version") != FORMAT_VERSION:
+        raise ValueError("Unsupported structure format version: " + str(metadata.get("format_version")))
+    n_elements = metadata["n_elements"]
+    stop = n_elements if stop is None else min(stop, n_elements)
+    transforms = arrays["transforms"][start:stop]
+    matrices = np.zeros((len(transforms), 4, 4), dtype=np.float32)
+    matrices[:, :3, :] = transforms
+    matrices[:, 3, 3] = 1.0
+    light_elements = np.asarray(arrays["light_elements"])
+    in_slice = (light_elements >= start) & (light_elements < stop)
+    structure = {
+        "first_element": start,
+        "matrices": matrices,
+        "prototypes": np.asarray(arrays["prototypes"][start:stop], dtype=np.int32),
+        "generations": np.asarray(arrays["generations"][start:stop], dtype=np.int32),
+        "parents": np.asarray(arrays["parents"][start:stop], dtype=np.int32),
+        "light_elements": light_elements[in_slice],
+        "light_indices": np.asarray(arrays["light_indices"])[in_slice].astype(np.int32),
+    }
+    return metadata, structure
@@ -0,0 +1,124 @@
+#
+# Tests of pure NumPy core modules, run with: python -m pytest -q
+# Author: Lovro Bosnar
+#
+
+import numpy as np
+
+import geometry
+import growth
+import growth_tree
+import structure_io
+
+def growth_kwargs(**kwargs):
+    face_centers, face_normals, face_areas = growth.unit_penta_sphere_faces()
+    return dict({"face_centers": face_centers, "face_normals": face_normals, "face_areas": face_areas, "n_iter": 5, "scale_range": (0.8, 1.0),
+                 "n_prototypes": 3, "face_grow_factor_per_iter": 0.8, "light_prototypes": [True, False, True], "n_lights": 2,
+                 "collision_tolerance": 0.1, "seed": 7}, **kwargs)
+
+def assert_structures_equal(a, b):
+    for key in growth.STRUCTURE_KEYS:
+        np.testing.assert_array_equal(np.asarray(a[key]), np.asarray(b[key]), err_msg=key)
+
+def test_resumed_growth_matches_uninterrupted(tmp_path):
+    path = str(tmp_path / "growth.ckpt")
+    full = growth.grow_transforms(**growth_kwargs())
+    first = list(growth.grow_generations(**growth_kwargs(n_iter=2, checkpoint_path=path)))
+    rest = list(growth.grow_generations(**growth_kwargs(resume_from=path)))
+    assert_structures_equal(full, growth.concatenate_generations(first + rest))
+
+def test_zero_budget_grows_only_starting_element():
+    for budget in ({"max_elements": 0}, {"max_frontier": 0}, {"max_bytes": 1}):
+        assert len(growth.grow_transforms(**growth_kwargs(**budget))["matrices"]) == 1
+
+def test_structure_does_not_depend_on_prototypes():
+    a = growth.grow_transforms(**growth_kwargs(n_prototypes=1, light_prototypes=[True]))
+    b = growth.grow_transforms(**growth_kwargs(n_prototypes=4, light_prototypes=[True, False, True, False], n_lights=5))
+    np.testing.assert_array_equal(a["matrices"], b["matrices"])
+
+def test_spatial_hash_matches_sequential_insertion():
+    rng = np.random.default_rng(0)
+    centers = rng.random((400, 3)) * 10.0
+    radii = 0.5 * rng.random(400) ** 4 + 1e-3
+    spatial_hash = growth.SpatialHash(min_radius=1e-9)
+    spatial_hash.insert(centers[:100], radii[:100])
+    inserted = spatial_hash.insert_non_overlapping(centers[100:], radii[100:], tolerance=0.1)
+    # Reference: brute force insertion one by one.
+    placed = list(range(100))
+    expected = np.zeros(300, dtype=bool)
+    for i in range(100, 400):
+        distances = np.linalg.norm(centers[placed] - centers[i], axis=1)
+        if not (distances < (radii[placed] + radii[i]) * 0.9).any():
+            placed.append(i)
+            expected[i - 100] = True
+    np.testing.assert_array_equal(inserted, expected)
+
+def tree_kwargs(**kwargs):
+    kwargs = dict(growth_kwargs(n_iter=4), **kwargs)
+    del kwargs["collision_tolerance"]
+    return kwargs
+
+def test_regrow_with_unchanged_parameters_keeps_tree():
+    tree = growth_tree.grow_tree(**tree_kwargs())
+    regrown = growth_tree.regrow(tree, from_generation=2)
+    for key in growth_tree.NODE_KEYS:
+        np.testing.assert_array_equal(tree[key], regrown[key], err_msg=key)
+
+def test_regrow_keeps_earlier_generations():
+    tree = growth_tree.grow_tree(**tree_kwargs())
+    regrown = growth_tree.regrow(tree, from_generation=3, scale_range=(0.5, 0.6))
+    kept = tree["generations"] < 3
+    n_kept = int(kept.sum())
+    np.testing.assert_array_equal(regrown["keys"][:n_kept], tree["keys"][kept])
+    np.testing.assert_array_equal(regrown["matrices"][:n_kept], tree["matrices"][kept])
+    assert (regrown["generations"][n_kept:] >= 3).all()
+
+def test_regrow_with_fewer_prototypes_repicks_kept_nodes():
+    tree = growth_tree.grow_tree(**tree_kwargs())
+    regrown = growth_tree.regrow(tree, from_generation=3, n_prototypes=1, light_prototypes=[False])
+    assert (regrown["prototypes"] == 0).all()
+    assert (regrown["lights"] == -1).all()
+
+# Regular dodecahedron (12 pentagons with outward winding), dual of the growth icosahedron.
+def dodecahedron():
+    ico = growth.ICOSPHERE_VERTICES
+    edge = np.min([np.linalg.norm(a - b) for i, a in enumerate(ico) for b in ico[i + 1:]])
+    triangles = [(i, j, k) for i in range(12) for j in range(i + 1, 12) for k in range(j + 1, 12)
+                 if all(np.isclose(np.linalg.norm(ico[a] - ico[b]), edge, rtol=1e-3) for a, b in ((i, j), (j, k), (i, k)))]
+    vertices = np.array([ico[list(triangle)].mean(axis=0) for triangle in triangles])
+    pentagons = []
+    for i, normal in enumerate(ico):
+        around = [t for t, triangle in enumerate(triangles) if i in triangle]
+        tangent = np.cross(normal, [0.0, 0.0, 1.0]) if abs(normal[2]) < 0.9 else np.cross(normal, [1.0, 0.0, 0.0])
+        bitangent = np.cross(normal, tangent)
+        offsets = vertices[around] - normal
+        pentagons.append([around[j] for j in np.argsort(np.arctan2(offsets @ bitangent, offsets @ tangent))])
+    return vertices, np.array(pentagons)
+
+def test_hollow_penta_sphere_is_closed_manifold():
+    vertices, pentagons = dodecahedron()
+    arrays = geometry.hollow_penta_sphere(vertices, pentagons, hole_size=0.5)
+    polygons = arrays["loop_vertices"].reshape(-1, 4)
+    # Every directed edge is used once and its opposite once: closed, manifold and consistently oriented.
+    edges = np.stack((polygons, np.roll(polygons, -1, axis=1)), axis=2).reshape(-1, 2)
+    directed, counts = np.unique(edges, axis=0, return_counts=True)
+    assert (counts == 1).all()
+    assert len(np.unique(np.sort(edges, axis=1), axis=0)) * 2 == len(directed)
+    # Every vertex is used.
+    assert len(np.unique(polygons)) == len(arrays["vertices"])
+
+def test_structure_export_import_round_trip(tmp_path):
+    path = str(tmp_path / "structure.bin")
+    structure = growth.compact(growth.grow_transforms(**growth_kwargs()))
+    structure_io.export_structure(path, structure, {"seed": 7})
+    metadata, imported = structure_io.import_structure(path)
+    assert metadata["seed"] == 7
+    assert_structures_equal(structure, imported)
+    # Slice holds its elements and only lights of them, with global element indices.
+    start, stop = 10, 50
+    _, part = structure_io.import_structure(path, start=start, stop=stop)
+    np.testing.assert_array_equal(part["matrices"], structure["matrices"][start:stop])
+    np.testing.assert_array_equal(part["parents"], structure["parents"][start:stop])
+    in_slice = (structure["light_elements"] >= start) & (structure["light_elements"] < stop)
+    np.testing.assert_array_equal(part["light_elements"], structure["light_elements"][in_slice])
+    np.testing.assert_array_equal(part["light_indices"], structure["light_indices"][in_slice])